@@ -0,0 +1,24 @@
+"""
+Cache backends shared by the input source plug-ins
+
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from .base import Cache
+from .file import FileCache
+from .sqlite import SqliteCache
+from .lazy import LazyIssues
+
+BACKENDS = {
+    'file': FileCache,
+    'sqlite': SqliteCache,
+}
+
+def create_cache(config: dict, namespace: str, ignore: bool = False, text: bool = False) -> Cache:
+    """
+    Create the cache backend selected by the `backend` key of an input source's `cache` configuration
+    """
+    backend = config.get('backend', 'file')
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown cache backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend](config, namespace, ignore = ignore, text = text)
@@ -0,0 +1,66 @@
+"""
+Base for all cache backends
+
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from abc import ABC, abstractmethod
+from typing import List
+
+class Cache(ABC):
+    """
+    Base class for all cache backends
+
+    Content is either JSON-compatible data, or plain text when the backend is created with `text = True`.
+    Reads return None for missing entries, for entries older than the refresh period or the given `max_age`
+    in seconds (unless `expire` is False),
+    and for everything when the cache is ignored (forced refresh).
+    """
+    def __init__(self, config: dict, namespace: str, ignore: bool = False, text: bool = False):
+        self.config = config
+        self.namespace = namespace
+        self.ignore = ignore
+        self.text = text
+        self.refresh = int(config['refresh'])
+
+    @abstractmethod
+    def read(self, key: str, expire: bool = True, max_age: int = None):
+        """
+        Read a cache entry
+        """
+
+    @abstractmethod
+    def write(self, key: str, content) -> None:
+        """
+        Write a cache entry
+        """
+
+    def read_issue(self, key: str, expire: bool = True) -> dict:
+        """
+        Read a single Jira issue by its issue key
+        """
+        return self.read(key, expire)
+
+    def write_issue(self, key: str, issue: dict) -> None:
+        """
+        Write a single Jira issue by its issue key
+        """
+        self.write(key, issue)
+
+    def read_issues(self, key: str, expire: bool = True) -> List[dict]:
+        """
+        Read the results of a named Jira query
+        """
+        return self.read(key, expire)
+
+    def write_issues(self, key: str, issues: List[dict]) -> None:
+        """
+        Write the results of a named Jira query
+        """
+        self.write(key, issues)
+
+    def close(self) -> None:
+        """
+        Release any resources held by the backend
+        """
+        # pass
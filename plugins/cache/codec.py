@@ -0,0 +1,50 @@
+"""
+Compact cache serialization
+
+Cache entries are minified JSON wrapped in a versioned envelope and compressed with gzip.
+orjson is used for encoding and decoding when it is installed, and the standard json module otherwise.
+
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError: # optional, faster JSON codec
+    orjson = None
+
+FORMAT_VERSION = 2
+
+def dumps(content, codec: str = 'auto') -> bytes:
+    """
+    Minified JSON
+    """
+    if orjson and codec in [ 'auto', 'orjson' ]:
+        return orjson.dumps(content)
+    return json.dumps(content, separators = (',', ':')).encode('utf-8')
+
+def loads(data: bytes, codec: str = 'auto'):
+    """
+    Parse JSON produced by dumps() or by the standard json module
+    """
+    if orjson and codec in [ 'auto', 'orjson' ]:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def pack(content, codec: str = 'auto', level: int = 6) -> bytes:
+    """
+    Versioned, minified and compressed cache entry
+    """
+    return gzip.compress(dumps({ 'format': FORMAT_VERSION, 'content': content }, codec), compresslevel = level)
+
+def unpack(data: bytes, codec: str = 'auto'):
+    """
+    Content of a cache entry produced by pack(), raises ValueError for other format versions or invalid JSON,
+    and EOFError, OSError (gzip.BadGzipFile) or zlib.error for truncated or corrupt data
+    """
+    envelope = loads(gzip.decompress(data), codec)
+    if envelope.get('format') != FORMAT_VERSION:
+        raise ValueError(f"unsupported cache format {envelope.get('format')}, expected {FORMAT_VERSION}")
+    return envelope['content']
@@ -0,0 +1,184 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+import os
+import mmap
+import time
+import json
+import struct
+import logging
+import zlib
+import threading
+from itertools import accumulate
+from typing import List
+
+from .base import Cache
+from .lazy import LazyIssues
+from . import codec
+
+logger = logging.getLogger(__name__)
+
+# header of the indexed query results: magic, then the length of the key -> offset index that follows it
+ISSUES_MAGIC = b'JIRAIDX1'
+ISSUES_HEADER = struct.Struct('<8sQ')
+
+def linked_keys(issue: dict) -> List[str]:
+    links = ((issue.get('fields') or { }).get('issuelinks') or [ ])
+    return [ link[direction]['key'] for link in links for direction in [ 'inwardIssue', 'outwardIssue' ] if link.get(direction) ]
+
+def filter_fields(issue: dict) -> list:
+    fields = issue.get('fields') or { }
+    resolution = fields.get('resolution')
+    return [ resolution['name'] if resolution else '', [ version['name'] for version in fields.get('fixVersions') or [ ] ] ]
+
+class FileCache(Cache):
+    """
+    One file per cache entry in the cache folder
+
+    JSON content goes into `<key>.json.gz` in the compact format, or into `<key>.json` when the
+    `format` is `json`. Existing `<key>.json` files are still read when there is no compact file.
+
+    With the `indexed` format, the results of named Jira queries go into `<key>.issues` instead: a key -> offset
+    index, along with the keys of the issues each one links to and its resolution and fix versions, followed by
+    the minified JSON of every issue, uncompressed, so that the file can be memory-mapped and each issue decoded
+    only when it is asked for (see LazyIssues). The mapped files stay open until the cache is closed.
+    Other entries use the compact format.
+    """
+    def __init__(self, config: dict, namespace: str, ignore: bool = False, text: bool = False):
+        super().__init__(config, namespace, ignore, text)
+        self.folder = config['folder']
+        self.compact = config.get('format', 'compact') in [ 'compact', 'indexed' ]
+        self.indexed = config.get('format', 'compact') == 'indexed'
+        self.codec = config.get('codec', 'auto')
+        self.level = int(config.get('level', 6))
+        self.mapped = [ ] # memory-mapped query results, see map_issues
+        os.makedirs(self.folder, exist_ok = True)
+
+    def filename(self, key: str, compact: bool = False) -> str:
+        if self.text:
+            return os.path.join(self.folder, key)
+        if compact:
+            return os.path.join(self.folder, f"{key}.json.gz")
+        return os.path.join(self.folder, f"{key}.json")
+
+    def issues_filename(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.issues")
+
+    def read(self, key: str, expire: bool = True, max_age: int = None):
+        if self.ignore:
+            return None
+        for compact in ([ True, False ] if not self.text else [ False ]):
+            cache_file = self.filename(key, compact)
+            if os.path.exists(cache_file):
+                if not expire or os.stat(cache_file).st_mtime + (self.refresh if max_age is None else max_age) >= time.time():
+                    logger.debug(f"reading {key} from cache file {cache_file}")
+                    return self.load(cache_file, compact)
+                return None
+        return None
+
+    def load(self, cache_file: str, compact: bool):
+        if compact:
+            with open(cache_file, 'rb') as f:
+                try:
+                    return codec.unpack(f.read(), self.codec)
+                except (ValueError, EOFError, OSError, zlib.error) as err: # other format version, truncated or corrupt
+                    logger.warning(f"ignoring cache file {cache_file}: {err}")
+                    return None
+        with open(cache_file, 'r') as f:
+            if self.text:
+                return f.read()
+            return json.load(f)
+
+    def write(self, key: str, content) -> None:
+        compact = self.compact and not self.text
+        cache_file = self.filename(key, compact)
+        logger.debug(f"writing {key} into cache file {cache_file}")
+        # write and rename, so that concurrent readers never see a partial file
+        temp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if compact:
+            with open(temp_file, 'wb') as f:
+                f.write(codec.pack(content, self.codec, self.level))
+        else:
+            with open(temp_file, 'w') as f:
+                if self.text:
+                    f.write(content)
+                else:
+                    json.dump(content, f, indent = 4)
+        os.replace(temp_file, cache_file)
+        if compact and os.path.exists(self.filename(key)):
+            os.remove(self.filename(key)) # superseded by the compact file
+        elif not compact and not self.text and os.path.exists(self.filename(key, True)):
+            os.remove(self.filename(key, True))
+
+    def read_issues(self, key: str, expire: bool = True) -> List[dict]:
+        issues_file = self.issues_filename(key)
+        if self.ignore or not os.path.exists(issues_file):
+            return super().read_issues(key, expire)
+        if expire and os.stat(issues_file).st_mtime + self.refresh < time.time():
+            return None
+        logger.debug(f"mapping {key} from cache file {issues_file}")
+        return self.map_issues(issues_file)
+
+    def map_issues(self, issues_file: str) -> LazyIssues:
+        with open(issues_file, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) # stays valid once the file is closed, or replaced
+        try:
+            magic, length = ISSUES_HEADER.unpack_from(data)
+            if magic != ISSUES_MAGIC:
+                raise ValueError('not an indexed cache file')
+            index = codec.loads(data[ISSUES_HEADER.size:ISSUES_HEADER.size + length], self.codec)
+            if index.get('format') != codec.FORMAT_VERSION:
+                raise ValueError(f"unsupported cache format {index.get('format')}, expected {codec.FORMAT_VERSION}")
+        except (ValueError, struct.error) as err:
+            logger.warning(f"ignoring cache file {issues_file}: {err}")
+            data.close()
+            return None
+        self.mapped.append(data)
+        base = ISSUES_HEADER.size + length
+        offsets = index['offsets']
+        links = index.get('links') # not in files written before the links were indexed
+        filters = index.get('filters') # nor these
+        return LazyIssues(index['keys'], lambda position: codec.loads(data[base + offsets[position]:base + offsets[position + 1]], self.codec),
+            (lambda: dict(zip(index['keys'], links))) if links is not None else None,
+            (lambda: dict(zip(index['keys'], map(tuple, filters)))) if filters is not None else None)
+
+    def write_issues(self, key: str, issues: List[dict]) -> None:
+        issues_file = self.issues_filename(key)
+        if not self.indexed:
+            super().write_issues(key, issues)
+            if os.path.exists(issues_file):
+                os.remove(issues_file) # superseded by the plain entry
+            return
+        logger.debug(f"writing {key} into cache file {issues_file}")
+        keys = [ ]
+        links = [ ]
+        filters = [ ]
+        chunks = [ ]
+        for issue in issues:
+            keys.append(issue['key'])
+            links.append(linked_keys(issue))
+            filters.append(filter_fields(issue))
+            chunks.append(codec.dumps(issue, self.codec))
+        index = codec.dumps({
+            'format': codec.FORMAT_VERSION,
+            'keys': keys,
+            'links': links,
+            'filters': filters,
+            'offsets': list(accumulate((len(chunk) for chunk in chunks), initial = 0)),
+        }, self.codec)
+        temp_file = f"{issues_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(ISSUES_HEADER.pack(ISSUES_MAGIC, len(index)))
+            f.write(index)
+            f.writelines(chunks)
+        os.replace(temp_file, issues_file)
+        for compact in [ True, False ]:
+            if os.path.exists(self.filename(key, compact)):
+                os.remove(self.filename(key, compact)) # superseded by the indexed file
+
+    def close(self) -> None:
+        # the issues read lazily from the mapped files can't be decoded any more
+        for data in self.mapped:
+            data.close()
+        self.mapped.clear()
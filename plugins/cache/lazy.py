@@ -0,0 +1,47 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from collections.abc import Sequence
+from typing import Callable, Dict, Iterable, List, Tuple
+
+class LazyIssues(Sequence):
+    """
+    Results of a named Jira query, read from the cache one issue at a time
+
+    The issue keys are known up front, in query order, and `load(position)` decodes the issue at a position
+    the first time it is asked for. Issues are not kept, callers are expected to keep what they decode.
+    When the cache keeps the links of the issues, `links()` returns the keys each issue links to, by issue key,
+    and when it keeps their resolution and fix versions, `filters()` returns them, by issue key.
+    """
+    def __init__(self, keys: Iterable[str], load: Callable[[int], dict], links: Callable[[], Dict[str, List[str]]] = None,
+            filters: Callable[[], Dict[str, Tuple[str, List[str]]]] = None):
+        self.keys = list(keys)
+        self.load = load
+        self.links = links
+        self.filters = filters
+
+    def linked_keys(self) -> Dict[str, List[str]]:
+        """
+        Keys of the issues linked from each issue, without decoding the issues, or None when the cache doesn't keep them
+        """
+        return self.links() if self.links else None
+
+    def filter_fields(self) -> Dict[str, Tuple[str, List[str]]]:
+        """
+        Resolution name ('' for none) and fix version names of each issue, without decoding the issues,
+        or None when the cache doesn't keep them
+        """
+        return self.filters() if self.filters else None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [ self.load(index) for index in range(*position.indices(len(self.keys))) ]
+        if position < 0:
+            position += len(self.keys)
+        if not 0 <= position < len(self.keys):
+            raise IndexError(position)
+        return self.load(position)
@@ -0,0 +1,221 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from typing import Dict, List, Tuple
+import os
+import time
+import logging
+import sqlite3
+import threading
+import weakref
+
+from .base import Cache
+from .lazy import LazyIssues
+from . import codec
+
+logger = logging.getLogger(__name__)
+
+# open caches, whose connection must not be shared with a forked process (such as the Excel output workers):
+# one handler reopens them in the child
+connected = weakref.WeakSet()
+
+def reconnect_after_fork() -> None:
+    for cache in list(connected):
+        cache.connect()
+
+os.register_at_fork(after_in_child = reconnect_after_fork)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    content TEXT NOT NULL,
+    cached REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS issues (
+    key TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    issue_type TEXT,
+    updated TEXT,
+    content TEXT NOT NULL,
+    cached REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS issues_project ON issues (project);
+CREATE INDEX IF NOT EXISTS issues_issue_type ON issues (issue_type);
+CREATE INDEX IF NOT EXISTS issues_updated ON issues (updated);
+CREATE TABLE IF NOT EXISTS queries (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    cached REAL NOT NULL,
+    PRIMARY KEY (namespace, name)
+);
+CREATE TABLE IF NOT EXISTS query_issues (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (namespace, name, position)
+);
+CREATE TABLE IF NOT EXISTS links (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    link_type TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    PRIMARY KEY (source, target, link_type, direction)
+);
+CREATE INDEX IF NOT EXISTS links_target ON links (target);
+"""
+
+class SqliteCache(Cache):
+    """
+    All cache entries in a single SQLite database
+
+    Jira issues are stored once by issue key, indexed by project, issue type and update time,
+    and named queries keep an ordered list of issue keys. Issue links are kept in an edge table.
+    Query results are read lazily, each issue is decoded the first time it is asked for (see LazyIssues).
+    """
+    def __init__(self, config: dict, namespace: str, ignore: bool = False, text: bool = False):
+        super().__init__(config, namespace, ignore, text)
+        self.codec = config.get('codec', 'auto')
+        self.database = config.get('database') or os.path.join(config['folder'], 'cache.db')
+        os.makedirs(os.path.dirname(self.database) or '.', exist_ok = True)
+        self.connect()
+
+    def connect(self) -> None:
+        logger.debug(f"opening cache database {self.database}")
+        # the input sources fetch in worker threads, so share one connection behind a lock
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.database, timeout = 30, check_same_thread = False)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.executescript(SCHEMA)
+        connected.add(self)
+
+    def is_fresh(self, cached: float, expire: bool, max_age: int = None) -> bool:
+        return not expire or cached + (self.refresh if max_age is None else max_age) >= time.time()
+
+    def encode(self, content) -> str:
+        if self.text:
+            return content
+        return codec.dumps(content, self.codec).decode('utf-8')
+
+    def decode(self, content: str):
+        if self.text:
+            return content
+        return codec.loads(content, self.codec)
+
+    def read(self, key: str, expire: bool = True, max_age: int = None):
+        if self.ignore:
+            return None
+        with self.lock:
+            row = self.db.execute('SELECT content, cached FROM entries WHERE namespace = ? AND key = ?', (self.namespace, key)).fetchone()
+        if row and self.is_fresh(row[1], expire, max_age):
+            logger.debug(f"reading {key} from cache database {self.database}")
+            return self.decode(row[0])
+        return None
+
+    def write(self, key: str, content) -> None:
+        logger.debug(f"writing {key} into cache database {self.database}")
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO entries (namespace, key, content, cached) VALUES (?, ?, ?, ?)', (self.namespace, key, self.encode(content), time.time()))
+
+    def read_issue(self, key: str, expire: bool = True) -> dict:
+        if self.ignore:
+            return None
+        with self.lock:
+            row = self.db.execute('SELECT content, cached FROM issues WHERE key = ?', (key, )).fetchone()
+        if row and self.is_fresh(row[1], expire):
+            logger.debug(f"reading issue {key} from cache database {self.database}")
+            return codec.loads(row[0], self.codec)
+        return None
+
+    def write_issue(self, key: str, issue: dict) -> None:
+        logger.debug(f"writing issue {key} into cache database {self.database}")
+        with self.lock, self.db:
+            self.store_issues([ issue ], time.time())
+
+    def read_issues(self, key: str, expire: bool = True) -> List[dict]:
+        if self.ignore:
+            return None
+        with self.lock:
+            row = self.db.execute('SELECT cached FROM queries WHERE namespace = ? AND name = ?', (self.namespace, key)).fetchone()
+            if not row or not self.is_fresh(row[0], expire):
+                return None
+            logger.debug(f"reading query {key} from cache database {self.database}")
+            rows = self.db.execute("""
+                SELECT issues.key FROM query_issues JOIN issues ON issues.key = query_issues.key
+                WHERE query_issues.namespace = ? AND query_issues.name = ? ORDER BY query_issues.position""", (self.namespace, key)).fetchall()
+        keys = [ issue_key for issue_key, in rows ]
+        return LazyIssues(keys, lambda position: self.load_issue(keys[position]), lambda: self.query_links(key),
+            lambda: self.query_filters(key))
+
+    def load_issue(self, key: str) -> dict:
+        with self.lock:
+            content, = self.db.execute('SELECT content FROM issues WHERE key = ?', (key, )).fetchone()
+        return codec.loads(content, self.codec)
+
+    def write_issues(self, key: str, issues: List[dict]) -> None:
+        logger.debug(f"writing query {key} into cache database {self.database}")
+        now = time.time()
+        with self.lock, self.db:
+            self.store_issues(issues, now)
+            self.db.execute('DELETE FROM query_issues WHERE namespace = ? AND name = ?', (self.namespace, key))
+            self.db.executemany('INSERT INTO query_issues (namespace, name, position, key) VALUES (?, ?, ?, ?)',
+                [ (self.namespace, key, position, issue['key']) for position, issue in enumerate(issues) ])
+            self.db.execute('INSERT OR REPLACE INTO queries (namespace, name, cached) VALUES (?, ?, ?)', (self.namespace, key, now))
+
+    def store_issues(self, issues: List[dict], cached: float) -> None:
+        # caller holds the lock and the transaction
+        rows = [ ]
+        edges = [ ]
+        for issue in issues:
+            fields = issue.get('fields') or { }
+            issue_type = (fields.get('issuetype') or { }).get('id')
+            rows.append((issue['key'], issue['key'].split('-')[0], issue_type, fields.get('updated'), codec.dumps(issue, self.codec).decode('utf-8'), cached))
+            for link in fields.get('issuelinks') or [ ]:
+                for direction in [ 'inward', 'outward' ]:
+                    target = link.get(f'{direction}Issue')
+                    if target:
+                        edges.append((issue['key'], target['key'], link['type']['id'], direction))
+        self.db.executemany('INSERT OR REPLACE INTO issues (key, project, issue_type, updated, content, cached) VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.db.executemany('DELETE FROM links WHERE source = ?', [ (row[0], ) for row in rows ])
+        self.db.executemany('INSERT OR IGNORE INTO links (source, target, link_type, direction) VALUES (?, ?, ?, ?)', edges)
+
+    def query_links(self, key: str) -> Dict[str, List[str]]:
+        """
+        Keys of the issues linked from each issue of a named query, by issue key
+        """
+        with self.lock:
+            rows = self.db.execute("""
+                SELECT links.source, links.target FROM query_issues JOIN links ON links.source = query_issues.key
+                WHERE query_issues.namespace = ? AND query_issues.name = ? ORDER BY query_issues.position""", (self.namespace, key)).fetchall()
+        links = { }
+        for source, target in rows:
+            links.setdefault(source, [ ]).append(target)
+        return links
+
+    def query_filters(self, key: str) -> Dict[str, Tuple[str, List[str]]]:
+        """
+        Resolution name ('' for none) and fix version names of each issue of a named query, by issue key
+        """
+        with self.lock:
+            rows = self.db.execute("""
+                SELECT issues.key, json_extract(issues.content, '$.fields.resolution.name'), json_extract(issues.content, '$.fields.fixVersions')
+                FROM query_issues JOIN issues ON issues.key = query_issues.key
+                WHERE query_issues.namespace = ? AND query_issues.name = ? ORDER BY query_issues.position""", (self.namespace, key)).fetchall()
+        return { issue_key: (resolution or '', [ version['name'] for version in codec.loads(versions, self.codec) or [ ] ] if versions else [ ])
+            for issue_key, resolution, versions in rows }
+
+    def linked_keys(self, key: str) -> List[str]:
+        """
+        Keys of the issues linked to the given issue, in either direction
+        """
+        with self.lock:
+            rows = self.db.execute('SELECT target FROM links WHERE source = ? UNION SELECT source FROM links WHERE target = ?', (key, key)).fetchall()
+        return [ target for target, in rows ]
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+        connected.discard(self)
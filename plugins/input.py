@@ -12,6 +12,19 @@ class InputSource():
     Base class for all input source plug-ins
     """
     key = pluginlib.abstractattribute
+    client = 'default' # selected with the `client` setting, when there are several plug-ins for the same key
 
     def __init__(self, config: dict):
         self.config = config
+
+    def prefetch(self) -> None:
+        """
+        Load the input data up front, before any output generator runs
+        """
+        # pass
+
+    def close(self) -> None:
+        """
+        Release any resources held by the input source, after all output generators are done
+        """
+        # pass
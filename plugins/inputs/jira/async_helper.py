@@ -0,0 +1,159 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from typing import List
+import json
+import asyncio
+import logging
+import threading
+import aiohttp
+import requests
+from requests.exceptions import HTTPError
+
+from .helper import JiraHelper
+from .session import RETRY_STATUS, TokenBucket, retry_delay
+
+logger = logging.getLogger(__name__)
+
+class AsyncJiraHelper(JiraHelper):
+    """
+    Jira input source with the same interface as JiraHelper, where all REST requests run on a single asyncio
+    event loop with aiohttp. Query pages, metadata revalidations and link prefetches overlap on that loop, and the
+    requests are bounded by the http concurrency, rate and burst settings. Select it with `client: async`.
+    """
+    _alias_ = 'Async Jira'
+    client = 'async'
+
+    def connect(self) -> None:
+        if str(self.config['replay']['mode']).lower() not in [ 'off', 'false' ]:
+            # aiohttp doesn't go through the requests transport adapters that record and replay
+            raise ValueError("the async Jira client doesn't support replay, use the default client")
+        http = self.config['http']
+        self.retries = int(http['retries'])
+        self.backoff = float(http['backoff'])
+        self.max_backoff = float(http['max_backoff'])
+        rate = float(http['rate'])
+        self.bucket = TokenBucket(rate, int(http['burst'])) if rate > 0 else None
+        # the report model is synchronous, so the event loop runs in its own thread and
+        # the synchronous methods wait on the coroutines they submit to it
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target = self.loop.run_forever, name = 'jira-async', daemon = True)
+        self.loop_thread.start()
+        self.run(self.open_session())
+
+    async def open_session(self) -> None:
+        http = self.config['http']
+        self.semaphore = asyncio.Semaphore(int(http['concurrency']))
+        self.http = aiohttp.ClientSession(
+            auth = aiohttp.BasicAuth(self.config['username'], self.config['api_token']),
+            timeout = aiohttp.ClientTimeout(total = int(http['timeout'])),
+            connector = aiohttp.TCPConnector(limit = int(http['pool_size']), force_close = not http['keep_alive']),
+            raise_for_status = False)
+
+    def run(self, coroutine):
+        if not self.loop_thread.is_alive(): # in a forked process, which doesn't inherit the event loop thread
+            coroutine.close()
+            raise RuntimeError('the Jira event loop is not running in this process')
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def get(self, path: str, params: dict = None):
+        _, content, _ = await self.request(path, params)
+        return content
+
+    async def request(self, path: str, params: dict = None, headers: dict = None) -> tuple:
+        url = f"{self.config['base_url']}/{path}"
+        params = { key: value for key, value in (params or { }).items() if value is not None }
+        attempt = 0
+        while True:
+            if self.bucket:
+                await self.bucket.acquire_async()
+            async with self.semaphore:
+                async with self.http.get(url, params = params, headers = headers) as response:
+                    if response.status not in RETRY_STATUS or attempt >= self.retries:
+                        self.raise_for_status(response)
+                        content = await response.json() if response.status != 304 else None
+                        return response.status, content, response.headers
+                    delay = retry_delay(response.headers.get('Retry-After'), attempt, self.backoff, self.max_backoff)
+            logger.warning(f"GET {path} returned {response.status}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def raise_for_status(response) -> None:
+        # raise the same error as the requests based client, so that JiraHelper handles it
+        if response.status >= 400:
+            error = requests.Response()
+            error.status_code = response.status
+            error.reason = response.reason
+            error.url = str(response.url)
+            raise HTTPError(f"{response.status} {response.reason} for url {response.url}", response = error)
+
+    def fetch_conditional(self, path: str, validators: dict) -> tuple:
+        headers = { 'Accept': 'application/json' }
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        status, content, headers = self.run(self.request(path, headers = headers))
+        if status == 304:
+            return None, validators
+        return content, { 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified') }
+
+    def fetch_issue(self, issue_key: str) -> dict:
+        return self.run(self.get(f'rest/api/2/issue/{issue_key}', { 'fields': ','.join(self.field_list) }))
+
+    def search(self, jql: str, name: str, fields: List[str] = None, expand: str = 'renderedFields') -> List[dict]:
+        results = self.run(self.search_async(jql, name, fields or self.field_list, expand))
+        if self.projection and expand == 'renderedFields':
+            self.trim_rendered_fields(results)
+        return results
+
+    async def search_async(self, jql: str, name: str, fields: List[str], expand: str) -> List[dict]:
+        # same paging as JiraHelper.search, with the remaining pages gathered on the loop
+        res = await self.fetch_page_async(jql, name, 0, fields, expand)
+        results = list(res['issues'])
+        count = int(res['maxResults'])
+        total = int(res['total'])
+        if 0 < count < total:
+            pages = await asyncio.gather(*[ self.fetch_page_async(jql, name, start, fields, expand) for start in range(count, total, count) ])
+            for res in pages:
+                results.extend(res['issues'])
+        return results
+
+    async def fetch_page_async(self, jql: str, name: str, start: int, fields: List[str], expand: str) -> dict:
+        logger.debug(f"fetching offset {start} of query {name} = [{jql}]")
+        res = await self.get('rest/api/2/search', { 'jql': jql, 'startAt': start, 'maxResults': self.page_size, 'fields': ','.join(fields), 'expand': expand })
+        logger.debug(f"got {len(res['issues'])} results at offset {start} out of {res['total']}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(res, indent = 4))
+        return res
+
+    def fetch_page(self, jql: str, name: str, start: int, fields: List[str], expand: str) -> dict:
+        return self.run(self.fetch_page_async(jql, name, start, fields, expand))
+
+    def fetch_keys(self, keys: List[str], name: str, expand: str = 'renderedFields') -> List[dict]:
+        async def fetch_chunk(chunk: List[str]) -> List[dict]:
+            try:
+                return await self.search_async(f"key IN ({', '.join(chunk)})", name, self.field_list, expand)
+            except HTTPError as err:
+                logger.warning(f"failed to fetch {name} {', '.join(chunk)}, reason {err.response.status_code}")
+                return [ ]
+
+        async def fetch_all():
+            chunks = [ keys[i:i + self.prefetch_chunk_size] for i in range(0, len(keys), self.prefetch_chunk_size) ]
+            return await asyncio.gather(*[ fetch_chunk(chunk) for chunk in chunks ])
+
+        results = [ issue for issues in self.run(fetch_all()) for issue in issues ]
+        if self.projection and expand == 'renderedFields':
+            self.trim_rendered_fields(results)
+        return results
+
+    def close(self) -> None:
+        super().log_stats(logging.INFO if self.config['verbose'] else logging.DEBUG)
+        self.markdown.save()
+        self.run(self.http.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+        self.cache.close()
@@ -3,13 +3,15 @@ Copyright (c) 2020, Tidepool Project
 All rights reserved.
 """
 from abc import ABC, abstractmethod
-import markdown
+from functools import cached_property
 
 class JiraBase(ABC):
     def __init__(self, issue, jira):
-        self.issue = issue
+        # raw issue JSON is decoded into a compact record, and not kept; records are not tested by class,
+        # because pluginlib may load the plugin modules more than once, each time with its own JiraRecord class
+        self.record = jira.decode(issue) if isinstance(issue, dict) else issue
         self.jira = jira
-        self.markdown = markdown.Markdown()
+        self.memo = { }
 
     def __eq__(self, other):
         return self.key == other.key
@@ -24,23 +26,37 @@ class JiraBase(ABC):
 
     @property
     def type(self) -> int:
-        return int(self.fields['issuetype']['id'])
+        return self.record.type
 
     @property
     def key(self) -> str:
-        return self.issue['key']
+        return self.record.key
 
     @property
     def project_key(self) -> str:
-        return self.key.split('-')[0]
+        return self.record.project_key
 
-    @property
-    def fields(self) -> dict:
-        return self.issue['fields'] or {}
+    @cached_property
+    def key_order(self) -> tuple:
+        # numerical sort of the right side of the issue key
+        # otherwise, LOOP-1234 would sort before LOOP-456
+        # this also includes the left side (project key) which is usually same
+        # nonetheless, may be useful if we're sorting stories from multiple projects, within an epic
+        return ( self.project_key, int(self.key.split('-')[1]) )
 
-    @property
-    def rendered_fields(self) -> dict:
-        return self.issue.get('renderedFields') or {}
+    @cached_property
+    def id_order(self) -> tuple:
+        # numerical sort of the each of the numbers in the id
+        # otherwise, 1.2.3 would sort before 1.12.3
+        return tuple(int(id_part) for id_part in self.id.split('.')) if self.id else ( 0, )
+
+    def field(self, name: str):
+        # custom field value, by its name in the fields mapping
+        return (self.record.custom or { }).get(self.jira.fields[name])
+
+    def rendered_field(self, name: str) -> str:
+        # rendered (HTML) field value, by its name in the fields mapping or its standard field name
+        return (self.record.rendered or { }).get(self.jira.fields.get(name, name))
 
     @property
     def url(self) -> str:
@@ -48,19 +64,19 @@ class JiraBase(ABC):
 
     @property
     def icon(self) -> str:
-        return self.fields['issuetype']['iconUrl']
+        return self.record.icon
 
     @property
     def status(self) -> str:
-        return self.fields['status']['name']
+        return self.record.status
 
     @property
     def status_category(self) -> str:
-        return self.fields['status']['statusCategory']['name']
+        return self.record.status_category
 
     @property
     def priority(self) -> str:
-        return self.fields['priority']['name']
+        return self.record.priority
 
     @property
     def summary(self):
@@ -68,15 +84,18 @@ class JiraBase(ABC):
 
     @property
     def raw_summary(self):
-        return self.fields['summary']
+        return self.record.summary
 
     @property
     def reason_for_deferral(self):
-        return self.fields[self.jira.fields['reason_for_deferral']]
+        return self.field('reason_for_deferral')
+
+    @property
+    def type_mask(self) -> int:
+        return self.record.type_mask
 
     def is_a(self, type_name: str) -> bool:
-        issue_type = self.jira.issue_types[type_name]
-        return self.type in issue_type['ids'] and self.project_key in issue_type['projects']
+        return self.record.type_mask & self.jira.types.issue_bits[type_name] != 0
 
     @property
     def is_story(self) -> bool:
@@ -0,0 +1,67 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from collections import OrderedDict
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class MarkdownConverter():
+    """
+    Markdown to HTML converter shared by all the Jira issues
+
+    The Markdown engine is only loaded for the first conversion, and conversions are kept in a bounded LRU cache
+    keyed by the SHA-1 of the text. When a cache backend is given, the conversions are read from and written back
+    to its `markdown` entry, so that they carry over between runs.
+    """
+    def __init__(self, size: int, cache = None):
+        self.size = size
+        self.cache = cache
+        self.engine = None
+        self.conversions = None
+        self.modified = False
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def convert(self, text: str) -> str:
+        if not text:
+            return ''
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        with self.lock:
+            if self.conversions is None:
+                self.load()
+            html = self.conversions.get(digest)
+            if html is not None:
+                self.conversions.move_to_end(digest)
+                self.hits += 1
+                return html
+            self.misses += 1
+            if self.engine is None:
+                import markdown # pylint: disable=import-outside-toplevel
+                self.engine = markdown.Markdown()
+            html = self.engine.reset().convert(text)
+            self.conversions[digest] = html
+            if len(self.conversions) > self.size:
+                self.conversions.popitem(last = False)
+            self.modified = True
+        return html
+
+    def load(self) -> None:
+        # conversions are keyed by content, so persisted entries never expire
+        persisted = self.cache.read('markdown', expire = False) if self.cache else None
+        self.conversions = OrderedDict(persisted or [ ])
+        logger.debug(f"loaded {len(self.conversions)} Markdown conversions")
+
+    def save(self) -> None:
+        with self.lock:
+            if self.cache and self.modified:
+                self.cache.write('markdown', list(self.conversions.items()))
+                self.modified = False
+
+    def log_stats(self, level: int = logging.INFO) -> None:
+        if self.hits or self.misses:
+            logger.log(level, f"Markdown conversions: {self.misses} converted, {self.hits} reused, {len(self.conversions or [ ])} cached")
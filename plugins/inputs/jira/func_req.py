@@ -5,15 +5,16 @@ All rights reserved.
 import logging
 
 from .issue import JiraIssue
+from .memo import memoized_property
 
 logger = logging.getLogger(__name__)
 
 class JiraFuncRequirement(JiraIssue):
     @property
     def id(self):
-        return self.fields[self.jira.fields['reference_id']] or ''
+        return self.field('reference_id') or ''
 
-    @property
+    @memoized_property
     def risks(self):
         all = set(super().risks)
         logger.debug(f'direct risks attached to {self.key}: {len(all)}')
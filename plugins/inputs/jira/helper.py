@@ -3,18 +3,26 @@ Copyright (c) 2020, Tidepool Project
 All rights reserved.
 """
 from functools import cached_property # import functools
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from collections import ChainMap, Counter
+from operator import attrgetter
+from typing import Dict, Iterable, List
 import os
-import time
 import logging
 import json
 import re
+import traceback
+import sysconfig
+import weakref
 import atlassian
 from requests.exceptions import HTTPError
 
 import plugins.input
+from plugins.cache import create_cache, LazyIssues
 
 from .issue import JiraIssue
+from .link import JiraLink, JiraLinkResolutionError
 from .epic import JiraEpic
 from .story import JiraStory
 from .bug import JiraBug
@@ -24,9 +32,46 @@ from .risk_score import JiraRiskScore
 from .func_req import JiraFuncRequirement
 from .user_req import JiraUserRequirement
 from .instruction import JiraInstruction
+from .session import JiraSession
+from .link_graph import JiraLinkGraph
+from .record import JiraRecord
+from .types import JiraTypes
+from .issue_index import JiraIssueIndex
+from .issue_map import JiraIssueMap
+from .converter import MarkdownConverter
+from .traceability import TRACE_RULES, Traceability, TraceRules, trace_requirements
 
 logger = logging.getLogger(__name__)
 
+INTERNAL_DIRS = tuple({ os.path.dirname(os.path.abspath(__file__)), *[ sysconfig.get_paths()[name] for name in [ 'stdlib', 'purelib', 'platlib' ] ] })
+REPLAY_BASE_URL = 'http://jira.replay' # recordings are not tied to a host, so replay doesn't need the Jira credentials
+
+# standard fields read by the model classes, in addition to the custom fields in the jira.yml fields mapping
+MODEL_FIELDS = [ 'issuetype', 'summary', 'status', 'priority', 'resolution', 'description', 'fixVersions', 'versions', 'components', 'issuelinks', 'updated' ]
+# fields the model classes use the rendered (HTML) value of, by their name in the fields mapping
+RENDERED_FIELDS = [ 'description', 'functional_requirements', 'done_criteria', 'test_strategy', 'sequence_of_events', 'hazard_category',
+    'initial_severity', 'initial_probability', 'initial_risk', 'residual_severity', 'residual_probability', 'residual_risk', 'benefit' ]
+
+def issue_key(issue) -> str:
+    return issue if isinstance(issue, str) else issue.key
+
+def call_site() -> str:
+    # innermost frame outside of the Jira input source and of the libraries, i.e. the output or template that asked
+    for frame in reversed(traceback.extract_stack()):
+        if not frame.filename.startswith(INTERNAL_DIRS):
+            return f"{os.path.relpath(frame.filename)}:{frame.lineno} in {frame.name}"
+    return 'unknown'
+
+# helpers with pooled connections, which must not be shared with a forked process (such as the Excel output workers):
+# one handler reconnects those still open in the child
+connected = weakref.WeakSet()
+
+def reconnect_after_fork() -> None:
+    for helper in list(connected):
+        helper.connect()
+
+os.register_at_fork(after_in_child = reconnect_after_fork)
+
 class JiraHelper(plugins.input.InputSource):
     _alias_ = 'Jira'
     key = 'jira'
@@ -34,35 +79,64 @@ class JiraHelper(plugins.input.InputSource):
     def __init__(self, config: dict):
         super().__init__(config)
         if 'base_url' not in self.config:
-            self.config['base_url'] = os.environ.get('JIRA_BASE_URL')
+            self.config['base_url'] = os.environ.get('JIRA_BASE_URL') or (REPLAY_BASE_URL if str(self.config['replay']['mode']).lower() == 'replay' else None)
         if 'username' not in self.config:
             self.config['username'] = os.environ.get('JIRA_USERNAME')
         if 'api_token' not in self.config:
             self.config['api_token'] = os.environ.get('JIRA_API_TOKEN')
         logger.info(f"connecting to Jira as '{self.config['username']}'")
-        self.jira = atlassian.Jira(
-            url = self.config['base_url'],
-            username = self.config['username'],
-            password = self.config['api_token'])
-        self.cache_folder = self.config['cache']['folder']
-        self.cache_ignore = self.config['refresh_cache']
-        os.makedirs(self.cache_folder, exist_ok = True)
-        self.cache_refresh = int(self.config['cache']['refresh'])
+        self.connect()
+        self.cache = create_cache(self.config['cache'], self.key, ignore = self.config['refresh_cache'])
+        self.metadata_refresh = int(self.config['cache']['metadata_refresh'])
+        self.markdown = MarkdownConverter(int(self.config['markdown']['cache_size']), self.cache if self.config['markdown']['persist'] else None)
+        self.page_size = int(self.config['fetch']['page_size'])
+        self.page_workers = int(self.config['fetch']['page_workers'])
+        self.query_workers = int(self.config['fetch']['query_workers'])
+        self.prefetch_depth = int(self.config['prefetch']['depth'])
+        self.prefetch_chunk_size = int(self.config['prefetch']['chunk_size'])
+        self.incremental = bool(self.config['sync']['incremental'])
+        self.sync_overlap = int(self.config['sync']['overlap'])
         self.parameters = self.config['parameters']
         self.queries = self.config['queries']
         self.fields = self.config['fields']
         self.issue_types = self.config['issue_types']
         self.link_types = self.config['link_types']
+        self.types = JiraTypes(self.issue_types, self.link_types)
         self.junk_resolution = self.config['filters']['junk_resolution']
         self.done_status = self.config['filters']['done_status']
         self.blocked_status = self.config['filters']['blocked_status']
         self.device_qual_component = self.config['filters']['device_qual_component']
-        self.field_list = [ '*all', *[ f'-{field}' for field in self.config['exclude_fields'] ] ]
+        self.projection = bool(self.config['projection'])
+        self.rendered_field_ids = { self.fields.get(name, name) for name in RENDERED_FIELDS }
+        self.custom_field_ids = tuple(dict.fromkeys(self.fields.values()))
+        self.field_list = self.projected_field_list if self.projection else self.all_field_list
         logger.debug(f"requesting fields: {', '.join(self.field_list)}")
         self.missed = { }
-        self.all_fields
-        self.all_schemas
-        self.all_link_types
+        self.generation = 0 # incremented when the issues are refreshed, invalidates memoized relationships
+        self.memo_computed = Counter()
+        self.memo_reused = Counter()
+        self.strict_links = bool(self.config['link_resolution']['strict'])
+        self.link_resolutions = 0 # links resolved to issues that were already loaded
+        self.link_fetches = Counter() # links resolved by fetching the issue, by call site
+        self.load_metadata()
+
+    def connect(self) -> None:
+        self.session = JiraSession(self.config['http'], self.config['replay'])
+        self.jira = atlassian.Jira(
+            url = self.config['base_url'],
+            username = self.config['username'],
+            password = self.config['api_token'],
+            timeout = int(self.config['http']['timeout']),
+            session = self.session)
+        connected.add(self)
+
+    @property
+    def all_field_list(self) -> List[str]:
+        return [ '*all', *[ f'-{field}' for field in self.config['exclude_fields'] ] ]
+
+    @property
+    def projected_field_list(self) -> List[str]:
+        return [ *MODEL_FIELDS, *[ field_id for field_id in self.fields.values() if field_id not in MODEL_FIELDS ] ]
 
     @property
     def risk_scores(self):
@@ -70,50 +144,147 @@ class JiraHelper(plugins.input.InputSource):
 
     @cached_property
     def all_issues(self):
-        return { **self.func_requirements, **self.user_requirements, **self.risks, **self.stories, **self.bugs, **self.epics, **self.tests, **self.instructions }
+        self.fetch_queries()
+        # a view rather than a merged dict, so that lazily loaded issues stay unloaded until they are used;
+        # the first mapping wins, so they are in the reverse order of precedence
+        return ChainMap(self.instructions, self.tests, self.epics, self.bugs, self.stories, self.risks, self.user_requirements, self.func_requirements)
+
+    def load_metadata(self) -> None:
+        # fields and link types are independent of each other, the custom field schemas need the fields
+        with ThreadPoolExecutor(max_workers = 2) as executor:
+            for future in [ executor.submit(lambda: self.all_fields), executor.submit(lambda: self.all_link_types) ]:
+                future.result()
+        self.all_schemas
 
     @cached_property
     def all_fields(self):
-        fields = self.read_cache('fields')
-        if fields:
-            return fields
-        logger.info("fetching Jira fields")
-        fields = self.jira.get_all_fields()
-        logger.debug(f"Jira fields: {json.dumps(fields, indent = 4)}")
-        self.write_cache('fields', fields)
-        return fields
+        return self.read_metadata('fields', 'rest/api/2/field', 'fields')
 
     @cached_property
     def all_schemas(self):
-        schemas = self.read_cache('schemas')
+        schemas = self.cache.read('schemas', max_age = self.metadata_refresh)
         if schemas:
             return schemas
+        stale = self.cache.read('schemas', expire = False) or { }
+        validators = (self.cache.read('schemas.validators', expire = False) or { }) if stale else { }
         logger.info("fetching Jira custom field schemas")
-        schemas = {}
+        custom_keys = { }
         for key, field_id in self.fields.items():
             try:
-                custom_key = next(field['key'] for field in self.all_fields if field['id'] == field_id and field['id'] != field['key'] and field['schema']['type'] != 'string')
-                # not exposed in Atlassian Jira python API...
-                url = f"rest/api/2/field/{custom_key}/option"
-                schemas[key] = self.jira.get(url)
+                custom_keys[key] = next(field['key'] for field in self.all_fields if field['id'] == field_id and field['id'] != field['key'] and field['schema']['type'] != 'string')
             except StopIteration:
                 pass
+
+        def fetch_schema(key: str, custom_key: str):
+            try:
+                # not exposed in Atlassian Jira python API...
+                return self.fetch_conditional(f"rest/api/2/field/{custom_key}/option", validators.get(key, { }) if key in stale else { })
             except HTTPError as err:
-                logger.warn(f"failed to fetch custom field schema for {custom_key}, reason {err.response.status_code}")
+                logger.warning(f"failed to fetch custom field schema for {custom_key}, reason {err.response.status_code}")
+                return None
+
+        with ThreadPoolExecutor(max_workers = self.query_workers) as executor:
+            results = list(executor.map(fetch_schema, custom_keys.keys(), custom_keys.values()))
+        schemas = { }
+        validators = { }
+        for key, result in zip(custom_keys, results):
+            if result is None:
+                continue
+            schema, validators[key] = result
+            schemas[key] = stale[key] if schema is None else schema
         logger.debug(f"Jira custom field schemas: {json.dumps(schemas, indent = 4)}")
         self.write_cache('schemas', schemas)
+        self.write_cache('schemas.validators', validators)
         return schemas
 
     @cached_property
     def all_link_types(self):
-        link_types = self.read_cache('link_types')
-        if link_types:
-            return link_types
-        logger.info("fetching Jira link types")
-        link_types = self.jira.get_issue_link_types()
-        logger.debug(f"Jira link types: {json.dumps(link_types, indent = 4)}")
-        self.write_cache('link_types', link_types)
-        return link_types
+        return self.read_metadata('link_types', 'rest/api/2/issueLinkType', 'link types', 'issueLinkTypes')
+
+    def read_metadata(self, cache_key: str, path: str, name: str, member: str = None):
+        content = self.cache.read(cache_key, max_age = self.metadata_refresh)
+        if content:
+            return content
+        # revalidate the expired entry rather than downloading it again, when the server sent validators for it
+        stale = self.cache.read(cache_key, expire = False)
+        validators = (self.cache.read(f'{cache_key}.validators', expire = False) or { }) if stale else { }
+        logger.info(f"fetching Jira {name}")
+        content, validators = self.fetch_conditional(path, validators)
+        if content is None:
+            logger.info(f"Jira {name} not modified")
+            content = stale
+        else:
+            content = content[member] if member else content
+            logger.debug(f"Jira {name}: {json.dumps(content, indent = 4)}")
+        self.write_cache(cache_key, content)
+        self.write_cache(f'{cache_key}.validators', validators)
+        return content
+
+    def fetch_conditional(self, path: str, validators: dict) -> tuple:
+        """
+        GET a REST resource, conditionally on the ETag and Last-Modified validators of a previous response.
+        Returns the content, or None when the resource is not modified, and the validators to keep.
+        """
+        headers = { 'Accept': 'application/json' }
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        response = self.session.get(f"{self.config['base_url']}/{path}", headers = headers, timeout = int(self.config['http']['timeout']))
+        if response.status_code == 304:
+            return None, validators
+        response.raise_for_status()
+        return response.json(), { 'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified') }
+
+    # pre-sorted views of the collections, without junk
+    @cached_property
+    def sorted_func_requirements(self) -> List[JiraFuncRequirement]:
+        return self.sorted_by_id(self.exclude_junk(self.func_requirements.values(), enforce_versions = False))
+
+    @cached_property
+    def sorted_risks(self) -> List[JiraRisk]:
+        return self.sorted_by_harm(self.exclude_junk(self.risks.values(), enforce_versions = False))
+
+    @cached_property
+    def sorted_stories(self) -> List[JiraStory]:
+        return self.sorted_by_key(self.exclude_junk(self.stories.values(), enforce_versions = True))
+
+    @cached_property
+    def sorted_bugs(self) -> List[JiraBug]:
+        return self.sorted_by_fix_version(self.exclude_junk(self.bugs.values(), enforce_versions = False))
+
+    @cached_property
+    def issue_index(self) -> JiraIssueIndex:
+        # built once from the queried and prefetched issues; for query results read lazily, from the fields kept
+        # by the cache, so that indexing doesn't decode every issue (see queried_links)
+        index = JiraIssueIndex(self.junk_resolution)
+        for issues in self.all_issues.maps:
+            fields = issues.filter_fields() if hasattr(issues, 'filter_fields') else None
+            if fields is None:
+                index.add(issues.values())
+            else:
+                for key, (resolution, fix_versions) in fields.items():
+                    index.add_key(key, resolution, fix_versions)
+        index.add(self.missed.values())
+        return index
+
+    @cached_property
+    def traces(self) -> Dict[TraceRules, Traceability]:
+        return { }
+
+    def traceability(self, output: str) -> Traceability:
+        """
+        Traceability closure, following the rules of the output (see TRACE_RULES)
+        """
+        rules = TRACE_RULES[output]
+        if rules not in self.traces:
+            self.traces[rules] = trace_requirements(self, rules)
+        return self.traces[rules]
+
+    @cached_property
+    def link_graph(self) -> JiraLinkGraph:
+        # issues are indexed the first time their links are asked for, so that unused issues are never loaded
+        return JiraLinkGraph(self)
 
     def get_weight(self, key: str, id: str):
         logger.debug(f"getting weight for {key}, {id}")
@@ -162,36 +333,157 @@ class JiraHelper(plugins.input.InputSource):
         logger.info('fetching instructions')
         return self.to_dict(self.jql('instructions'), JiraInstruction)
 
+    def prefetch(self) -> None:
+        logger.info('prefetching Jira issues')
+        linked = self.queried_links()
+        for depth in range(self.prefetch_depth):
+            targets = [ key for key in dict.fromkeys(linked) if key not in self.all_issues and key not in self.missed ]
+            if not targets:
+                break
+            logger.info(f'prefetching {len(targets)} linked issues at depth {depth + 1}')
+            linked = [ link.key for issue in self.fetch_issues(targets) for link in issue.links ]
+        logger.info(f'done prefetching Jira issues, {len(self.all_issues)} queried and {len(self.missed)} linked issues')
+        # the issue index is built once from the queried and prefetched issues, before the outputs filter them
+        logger.info(f'indexed {len(self.issue_index.keys)} issues, {len(self.issue_index.junk)} of them junk')
+
+    def queried_links(self) -> List[str]:
+        # keys linked from the queried issues; for query results read lazily, from the links kept by the cache,
+        # so that prefetching doesn't decode every issue
+        linked = [ ]
+        for issues in self.all_issues.maps:
+            links = issues.linked_keys() if hasattr(issues, 'linked_keys') else None
+            if links is None:
+                links = { key: [ link.key for link in issue.links ] for key, issue in issues.items() }
+            for keys in links.values():
+                linked.extend(keys)
+        return linked
+
+    def fetch_issues(self, targets: List[str]) -> List[JiraIssue]:
+        issues = { }
+        for issue_key in targets:
+            issue = self.cache.read_issue(issue_key)
+            if issue:
+                issues[issue_key] = issue
+        # same fields and no rendering, to match what get_issue fetches one at a time
+        for issue in self.fetch_keys([ issue_key for issue_key in targets if issue_key not in issues ], 'linked issues', expand = None):
+            self.cache.write_issue(issue['key'], issue)
+            issues[issue['key']] = issue
+        fetched = [ ]
+        for issue_key in targets:
+            if issue_key in issues: # anything not found here is fetched on demand by get_issue
+                # the class comes from the issue type, as it would from a link to the issue
+                record = self.decode(issues[issue_key])
+                fetched.append(self.add_missed(globals()[self.types.issue_class(record.type_mask)](record, self)))
+        return fetched
+
+    def fetch_keys(self, keys: List[str], name: str, expand: str = 'renderedFields') -> List[dict]:
+        def fetch_chunk(chunk: List[str]) -> List[dict]:
+            try:
+                return self.search(f"key IN ({', '.join(chunk)})", name, expand = expand)
+            except HTTPError as err:
+                logger.warning(f"failed to fetch {name} {', '.join(chunk)}, reason {err.response.status_code}")
+                return [ ]
+
+        chunks = [ keys[i:i + self.prefetch_chunk_size] for i in range(0, len(keys), self.prefetch_chunk_size) ]
+        results = [ ]
+        with ThreadPoolExecutor(max_workers = self.query_workers) as executor:
+            for issues in executor.map(fetch_chunk, chunks):
+                results.extend(issues)
+        return results
+
+    def fetch_queries(self):
+        # evaluate the named query properties concurrently; each one caches its own result
+        queries = [ query for query in self.queries if isinstance(getattr(type(self), query, None), cached_property) ]
+        logger.debug(f"fetching queries {', '.join(queries)} with {self.query_workers} workers")
+        with ThreadPoolExecutor(max_workers = self.query_workers) as executor:
+            list(executor.map(lambda query: getattr(self, query), queries))
+
     def jql(self, query: str):
-        results = self.read_cache(query)
+        results = self.cache.read_issues(query)
         if results:
             return results
         jql = self.queries[query].format(**self.parameters)
-        results = [ ]
-        start = 0
-        while True:
-            logger.debug(f"fetching offset {start} of query {query} = [{jql}]")
-            res = self.jira.jql(jql, start = start, limit = 100, fields = self.field_list, expand = "renderedFields")
-            results.extend(res['issues'])
-            count = int(res['maxResults'])
-            total = int(res['total'])
-            logger.debug(f"got {count} results out of {total}")
-            if logger.isEnabledFor(logging.DEBUG):
-                logger.debug(json.dumps(res, indent = 4))
-            start += count
-            if start >= total:
-                break
-        self.write_cache(query, results)
+        results = self.sync(query, jql) if self.incremental else None
+        if results is None:
+            results = self.search(jql, query)
+        self.cache.write_issues(query, results)
+        if self.incremental:
+            self.write_cache(f'{query}.watermark', { 'updated': self.watermark(results).isoformat() })
+        return results
+
+    def sync(self, query: str, jql: str) -> List[dict]:
+        # bring an expired cache up to date with the issues changed since the last fetch,
+        # a forced refresh or a missing watermark falls back to fetching everything
+        cached = self.cache.read_issues(query, expire = False)
+        watermark = self.read_cache(f'{query}.watermark', expire = False)
+        if not cached or not watermark:
+            return None
+        since = datetime.fromisoformat(watermark['updated']) - timedelta(seconds = self.sync_overlap)
+        logger.info(f"synchronizing {query} with changes since {since}")
+        changed = self.search(f'({jql}) AND updated >= "{since:%Y/%m/%d %H:%M}"', query)
+
+        # key-only query for the current membership and order; drops deleted issues and
+        # issues that no longer match, and finds any that started matching without changing
+        keys = [ issue['key'] for issue in self.search(jql, f'{query} keys', fields = [ 'key' ], expand = None) ]
+        issues = { issue['key']: issue for issue in cached }
+        issues.update({ issue['key']: issue for issue in changed })
+        missing = [ issue_key for issue_key in keys if issue_key not in issues ]
+        if missing:
+            issues.update({ issue['key']: issue for issue in self.fetch_keys(missing, query) })
+        results = [ issues[issue_key] for issue_key in keys if issue_key in issues ]
+        logger.info(f"synchronized {query}: {len(changed)} changed, {len(missing)} added, {len(set(issue['key'] for issue in cached) - set(keys))} removed")
+        return results
+
+    @staticmethod
+    def watermark(issues: List[dict]) -> datetime:
+        updated = [ datetime.strptime(issue['fields']['updated'], '%Y-%m-%dT%H:%M:%S.%f%z') for issue in issues if (issue.get('fields') or {}).get('updated') ]
+        if updated:
+            return max(updated).astimezone(timezone.utc)
+        return datetime.now(timezone.utc)
+
+    def search(self, jql: str, name: str, fields: List[str] = None, expand: str = 'renderedFields') -> List[dict]:
+        def fetch_page(start: int) -> dict:
+            return self.fetch_page(jql, name, start, fields or self.field_list, expand)
+
+        # the first page tells us the total and the page size the server is willing to return,
+        # the remaining pages are fetched in parallel and reassembled in offset order
+        res = fetch_page(0)
+        results = list(res['issues'])
+        count = int(res['maxResults'])
+        total = int(res['total'])
+        if 0 < count < total:
+            with ThreadPoolExecutor(max_workers = self.page_workers) as executor:
+                for res in executor.map(fetch_page, range(count, total, count)):
+                    results.extend(res['issues'])
+        if self.projection and expand == 'renderedFields':
+            self.trim_rendered_fields(results)
         return results
 
+    def fetch_page(self, jql: str, name: str, start: int, fields: List[str], expand: str) -> dict:
+        logger.debug(f"fetching offset {start} of query {name} = [{jql}]")
+        res = self.jira.jql(jql, start = start, limit = self.page_size, fields = fields, expand = expand)
+        logger.debug(f"got {len(res['issues'])} results at offset {start} out of {res['total']}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(res, indent = 4))
+        return res
+
+    def trim_rendered_fields(self, issues: List[dict]) -> None:
+        # Jira renders every requested field, keep only the ones that are used
+        for issue in issues:
+            if issue.get('renderedFields'):
+                issue['renderedFields'] = { key: value for key, value in issue['renderedFields'].items() if key in self.rendered_field_ids }
+
     def __get_issue(self, issue_key: str, cls = JiraIssue):
-        issue = self.read_cache(issue_key)
+        issue = self.cache.read_issue(issue_key)
         if not issue:
-            issue = self.jira.get_issue(issue_key, fields = self.field_list)
+            issue = self.fetch_issue(issue_key)
             logger.debug(f'got issue {cls.__name__} {issue_key}: {json.dumps(issue, indent = 4)}')
-            self.write_cache(issue_key, issue)
+            self.cache.write_issue(issue_key, issue)
         return cls(issue, self)
 
+    def fetch_issue(self, issue_key: str) -> dict:
+        return self.jira.get_issue(issue_key, fields = self.field_list)
+
     def get_issue(self, issue_key: str, cls = JiraIssue):
         if isinstance(cls, str):
             cls = globals()[cls]
@@ -201,29 +493,82 @@ class JiraHelper(plugins.input.InputSource):
             issue = self.missed.get(issue_key)
             if not issue:
                 logger.debug(f'cache miss, fetching {cls.__name__} {issue_key}')
-                issue = self.__get_issue(issue_key, cls)
-                self.missed[issue_key] = issue
+                issue = self.add_missed(self.__get_issue(issue_key, cls))
+        return issue
+
+    def resolve_link(self, link: JiraLink, name: str) -> None:
+        """
+        Account for a link resolving its full issue, because `name` isn't part of the link payload
+        """
+        if link.key in self.all_issues or link.key in self.missed:
+            self.link_resolutions += 1
+            return
+        site = call_site()
+        message = f"{site} reads '{name}' of linked issue {link.key}, which was not loaded"
+        if self.strict_links:
+            raise JiraLinkResolutionError(message)
+        logger.info(f"{message}, fetching it")
+        self.link_fetches[site] += 1
+
+    def log_link_stats(self, level: int = logging.INFO) -> None:
+        logger.log(level, f"linked issues: {self.link_resolutions} resolved from loaded issues, {sum(self.link_fetches.values())} fetched")
+        for site, count in self.link_fetches.most_common():
+            logger.log(level, f"{site}: {count} linked issues fetched")
+
+    def add_missed(self, issue: JiraIssue) -> JiraIssue:
+        self.missed[issue.key] = issue
+        if 'issue_index' in self.__dict__: # keep the index up to date once it is built
+            self.issue_index.add([ issue ])
         return issue
 
-    def to_dict(self, issues: List[JiraIssue], issue_type: str) -> dict:
+    def decode(self, issue: dict) -> JiraRecord:
+        return JiraRecord.decode(issue, self.types, self.custom_field_ids, self.rendered_field_ids)
+
+    def to_dict(self, issues: List[dict], issue_type: str) -> dict:
+        if isinstance(issues, LazyIssues):
+            return JiraIssueMap(issues, lambda issue: issue_type(issue, self))
         return { issue.key: issue for issue in [ issue_type(issue, self) for issue in issues ] }
 
-    def read_cache(self, cache_key: str) -> dict:
-        if self.cache_ignore:
-            return None
-        cache_file = os.path.join(self.cache_folder, f"{cache_key}.json")
-        if os.path.exists(cache_file):
-            if os.stat(cache_file).st_mtime + self.cache_refresh >= time.time():
-                logger.debug(f"reading {cache_key} from cache file {cache_file}")
-                with open(cache_file, 'r') as f:
-                    return json.load(f)
-        return None
+    def read_cache(self, cache_key: str, expire: bool = True) -> dict:
+        return self.cache.read(cache_key, expire)
 
-    def write_cache(self, cache_key: str, content) -> dict:
-        cache_file = os.path.join(self.cache_folder, f"{cache_key}.json")
-        with open(cache_file, 'w') as f:
-            logger.debug(f"writing {cache_key} into cache file {cache_file}")
-            json.dump(content, f, indent = 4)
+    def write_cache(self, cache_key: str, content) -> None:
+        self.cache.write(cache_key, content)
+
+    def refresh(self) -> None:
+        """
+        Drop the loaded issues, so that they are read again from the cache or from Jira,
+        along with the link graph, the traceability and the relationships memoized on the issues
+        """
+        for name in [ 'all_issues', 'link_graph', 'issue_index', 'traces', 'sorted_func_requirements', 'sorted_risks', 'sorted_stories', 'sorted_bugs', *self.queries ]:
+            self.__dict__.pop(name, None)
+        self.missed = { }
+        self.generation += 1
+
+    def log_load_stats(self, level: int = logging.INFO) -> None:
+        for query in self.queries:
+            issues = self.__dict__.get(query)
+            if hasattr(issues, 'loaded'): # a JiraIssueMap, see to_dict
+                logger.log(level, f"{query}: {len(issues.loaded)} of {len(issues)} cached issues loaded")
+
+    def log_memo_stats(self, level: int = logging.INFO) -> None:
+        for name, computed in sorted(self.memo_computed.items()):
+            logger.log(level, f"{name}: computed {computed} times, {self.memo_reused[name]} recomputations avoided")
+
+    def log_stats(self, level: int = logging.INFO) -> None:
+        # statistics of the issue model, whichever client fetched the issues
+        self.log_load_stats(level)
+        self.log_memo_stats(level)
+        self.log_link_stats(level)
+        self.markdown.log_stats(level)
+
+    def close(self) -> None:
+        self.log_stats(logging.INFO if self.config['verbose'] else logging.DEBUG)
+        self.markdown.save()
+        self.session.log_stats(logging.INFO if self.config['verbose'] else logging.DEBUG)
+        self.session.close()
+        connected.discard(self)
+        self.cache.close()
 
     @staticmethod
     def prettify_links(text: str) -> str:
@@ -231,16 +576,28 @@ class JiraHelper(plugins.input.InputSource):
         text = re.sub(r"""\[(https://docs.google.+)\|([^]]+)\]""", r"""<a href="\1">Google Document</a>""", text)
         return re.sub(r"""(<a.+>)(?:https://tidepool.atlassian.net/browse/)(\w+-\d+)(</a>)""", r"""\1\2\3""", text)
 
-    @staticmethod
-    def exclude_junk(issues: List[JiraIssue], enforce_versions: bool = False) -> List[JiraIssue]:
-        if enforce_versions:
-            return [ issue for issue in issues if not issue.is_junk and issue.jira.parameters['fix_version'] in issue.full_issue.fix_versions ]
-        return [ issue for issue in issues if not issue.is_junk ]
+    def exclude_junk(self, issues: Iterable, enforce_versions: bool = False) -> list:
+        """
+        Issues (or issue keys) that are not junk, and with `enforce_versions`, that have the report fix version.
+        Keys are looked up in the issue index, issues are only loaded when they haven't been loaded at all.
+        Not a static method like the other filters, because of the index: call it on the JiraHelper instance.
+        """
+        index = self.issue_index
+        versioned = index.with_fix_version(self.parameters['fix_version']) if enforce_versions else None
+        included = [ ]
+        for issue in issues:
+            key = issue_key(issue)
+            if key not in index.keys: # not loaded yet, which also adds it to the index (and to versioned)
+                self.get_issue(key, getattr(issue, 'issue_class', JiraIssue))
+            if key not in index.junk and (versioned is None or key in versioned):
+                included.append(issue)
+        return included
 
     @staticmethod
-    def filter_by_key(issues: List[JiraIssue], filter: List[str]) -> List[JiraIssue]:
+    def filter_by_key(issues: Iterable, filter: List[str]) -> list:
         if filter:
-            return [ issue for issue in issues if issue.key in filter ]
+            keys = set(filter)
+            return [ issue for issue in issues if issue_key(issue) in keys ]
         return issues
 
     @staticmethod
@@ -250,28 +607,19 @@ class JiraHelper(plugins.input.InputSource):
             return [ issue for issue in issues if pattern.match(issue.id) ]
         return issues
 
+    # sort keys are computed once per issue, see JiraBase.key_order and friends
     @staticmethod
     def sorted_by_key(issues: List[JiraIssue]) -> List[JiraIssue]:
-        def issuekey(issue):
-            parts = issue.key.split('-')
-            return [ parts[0], int(parts[1]) ]
-
-        # numerical sort of the right side of the issuekey
-        # otherwise, LOOP-1234 would sort before LOOP-456
-        # this also includes the left side (project key) which is usually same
-        # nonetheless, may be useful if we're sorting stories from multiple projects, within an epic
-        return sorted(issues, key = issuekey)
+        return sorted(issues, key = attrgetter('key_order'))
 
     @staticmethod
     def sorted_by_id(issues: List[JiraIssue]) -> List[JiraIssue]:
-        # numerical sort of the each of the numbers in the id
-        # otherwise, 1.2.3 would sort before 1.12.3
-        return sorted(issues, key = lambda issue: [ int(id_part) for id_part in issue.id.split('.') ] if issue.id else [ 0 ] )
+        return sorted(issues, key = attrgetter('id_order'))
 
     @staticmethod
     def sorted_by_harm(issues: List[JiraIssue]) -> List[JiraIssue]:
-        return sorted(issues, key = lambda issue: f'{issue.harm}:{issue.hazard_category}')
+        return sorted(issues, key = attrgetter('harm_order'))
 
     @staticmethod
     def sorted_by_fix_version(issues: List[JiraIssue]) -> List[JiraIssue]:
-        return sorted(issues, key = lambda issue: f'{",".join(sorted(issue.fix_versions))}:{issue.status}:{issue.key}')
+        return sorted(issues, key = attrgetter('fix_version_order'))
@@ -3,76 +3,81 @@ Copyright (c) 2020, Tidepool Project
 All rights reserved.
 """
 import logging
+from functools import cached_property
 from typing import List
 from .base import JiraBase
 from .link import JiraLink
+from .link_dir import JiraLinkDirection
 
 logger = logging.getLogger(__name__)
 
 class JiraIssue(JiraBase):
     @property
     def epic_key(self):
-        return self.fields[self.jira.fields['epic_key']]
+        return self.field('epic_key')
 
     @property
     def resolution(self) -> str:
-        res = self.fields.get('resolution')
-        if res:
-            return res.get('name', '')
-        return ''
+        return self.record.resolution
 
     @property
     def description(self) -> str:
-        return self.rendered_fields.get('description') or self.raw_description
+        return self.rendered_field('description') or self.raw_description
 
     @property
     def raw_description(self) -> str:
-        return self.markdown.convert(self.fields.get('description') or '')
+        return self.jira.markdown.convert(self.record.description or '')
 
     @property
     def fix_versions(self) -> List[str]:
-        return [ version['name'] for version in self.fields['fixVersions'] ]
+        return list(self.record.fix_versions)
 
     @property
     def affects_versions(self) -> List[str]:
-        return [ version['name'] for version in self.fields['versions'] ]
+        return list(self.record.affects_versions)
 
     @property
     def components(self) -> List[str]:
-        return [ component['name'] for component in self.fields['components'] ]
+        return list(self.record.components)
+
+    @cached_property
+    def fix_version_order(self) -> str:
+        return f'{",".join(sorted(self.fix_versions))}:{self.status}:{self.key}'
 
     @property
     def links(self) -> List[JiraLink]:
-        return [ JiraLink(link, self.jira) for link in self.fields['issuelinks'] ]
+        return self.jira.link_graph.links(self)
 
     @property
     def linked(self):
-        return [ self.jira.get_issue(link.key, link.issue_class) for link in self.links ]
+        return self.jira.link_graph.linked(self)
 
     @property
     def stories(self):
-        return [ self.jira.get_issue(link.key, link.issue_class) for link in self.links if link.is_story ]
+        return self.jira.link_graph.linked(self, 'story')
 
     @property
     def tests(self):
-        return [ self.jira.get_issue(link.key, link.issue_class) for link in self.links if link.is_test ]
+        return self.jira.link_graph.linked(self, 'test')
 
     @property
     def risks(self):
-        return [ self.jira.get_issue(link.key, link.issue_class) for link in self.links if link.is_risk ]
+        return self.jira.link_graph.linked(self, 'risk')
 
     @property
     def relates_to(self):
-        return [ self.jira.get_issue(link.key, link.issue_class) for link in self.links if link.relates ]
+        return self.jira.link_graph.related(self, 'relates')
 
     @property
     def defines(self):
-        return [ self.jira.get_issue(link.key, link.issue_class) for link in self.links if link.defines ]
+        return self.jira.link_graph.related(self, 'defines', JiraLinkDirection.OUTWARD)
 
     @property
     def defined_by(self):
-        return [ self.jira.get_issue(link.key, link.issue_class) for link in self.links if link.is_defined_by ]
+        # either direction: the reports have always matched "is defined by" links both ways
+        return self.jira.link_graph.related(self, 'defines')
 
     @property
     def mitigated_by(self):
-        return [ self.jira.get_issue(link.key, link.issue_class) for link in self.links if link.is_mitigated_by ]
+        # either direction, like defined_by
+        return self.jira.link_graph.related(self, 'mitigates')
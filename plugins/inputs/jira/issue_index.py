@@ -0,0 +1,35 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from typing import Iterable, List, Set
+
+class JiraIssueIndex():
+    """
+    Keys of the loaded Jira issues that are junk, and keys by fix version
+
+    Issues are added once, when they are loaded or from the fields the cache keeps for them, so that filtering
+    by key never needs the issue itself.
+    """
+    def __init__(self, junk_resolution: Iterable[str]):
+        self.junk_resolution = set(junk_resolution)
+        self.keys = set()
+        self.junk = set()
+        self.fix_versions = { }
+
+    def add(self, issues: Iterable) -> None:
+        for issue in issues:
+            self.add_key(issue.key, issue.record.resolution, issue.record.fix_versions)
+
+    def add_key(self, key: str, resolution: str, fix_versions: List[str]) -> None:
+        if key in self.keys:
+            return
+        self.keys.add(key)
+        if resolution in self.junk_resolution:
+            self.junk.add(key)
+        for version in fix_versions:
+            self.fix_versions.setdefault(version, set()).add(key)
+
+    def with_fix_version(self, version: str) -> Set[str]:
+        # the indexed set itself, which includes the issues added later
+        return self.fix_versions.setdefault(version, set())
@@ -0,0 +1,45 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from collections.abc import Mapping
+from typing import Callable, Dict, List, Tuple
+
+from plugins.cache import LazyIssues
+
+class JiraIssueMap(Mapping):
+    """
+    Issues of a named query by issue key, in query order, created the first time they are looked up
+
+    Backed by query results read lazily from the cache, so that a run only decodes the issues it uses.
+    Membership and iteration only need the keys; values are created by `factory` and kept.
+    """
+    def __init__(self, issues: LazyIssues, factory: Callable):
+        self.issues = issues
+        self.factory = factory
+        self.positions = { key: position for position, key in enumerate(issues.keys) }
+        self.loaded = { }
+
+    def __getitem__(self, key: str):
+        issue = self.loaded.get(key)
+        if issue is None:
+            issue = self.factory(self.issues[self.positions[key]])
+            self.loaded[key] = issue
+        return issue
+
+    def __contains__(self, key) -> bool:
+        return key in self.positions
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def linked_keys(self) -> Dict[str, List[str]]:
+        # from the cache, None when it doesn't keep the links
+        return self.issues.linked_keys()
+
+    def filter_fields(self) -> Dict[str, Tuple[str, List[str]]]:
+        # from the cache, None when it doesn't keep them
+        return self.issues.filter_fields()
@@ -5,48 +5,42 @@ All rights reserved.
 from functools import cached_property # import functools
 from .base import JiraBase
 from .link_dir import JiraLinkDirection
+from .record import JiraLinkRecord
+
+class JiraLinkResolutionError(Exception):
+    """
+    Raised in strict mode when an attribute of a linked issue needs the full issue, and it wasn't loaded
+    """
 
 class JiraLink(JiraBase):
-    def __init__(self, link, jira):
+    """
+    Link to another Jira issue, as embedded in the linking issue
+
+    The key, summary, status, priority and issue type come from the link itself. Any other attribute resolves
+    the full linked issue, which JiraHelper.resolve_link counts, and fetches if it wasn't loaded.
+    """
+    def __init__(self, link: JiraLinkRecord, jira):
         self.link = link
-        if self.direction == JiraLinkDirection.INWARD:
-            issue = self.link['inwardIssue']
-        elif self.direction == JiraLinkDirection.OUTWARD:
-            issue = self.link['outwardIssue']
-        super().__init__(issue, jira)
+        super().__init__(link.issue, jira)
 
-    @cached_property
+    @property
     def direction(self) -> JiraLinkDirection:
-        if 'inwardIssue' in self.link:
-            return JiraLinkDirection.INWARD
-        elif 'outwardIssue' in self.link:
-            return JiraLinkDirection.OUTWARD
-        raise NotImplementedError
+        return self.link.direction
 
-    @cached_property
+    @property
     def issue_class(self) -> str:
-        if self.is_story:
-            return 'JiraStory'
-        elif self.is_risk:
-            return 'JiraRisk'
-        elif self.is_func_requirement:
-            return 'JiraFuncRequirement'
-        elif self.is_instruction:
-            return 'JiraInstruction'
-        elif self.is_test:
-            return 'JiraTest'
-        elif self.is_bug:
-            return 'JiraBug'
-        return 'JiraIssue'
+        return self.jira.types.issue_class(self.record.type_mask)
 
     @property
     def link_type(self) -> int:
-        return int(self.link['type']['id'])
+        return self.link.link_type
+
+    @property
+    def link_mask(self) -> int:
+        return self.link.link_mask
 
     def is_link(self, link_name: str, direction: JiraLinkDirection) -> bool:
-        if direction:
-            return self.link_type == self.jira.link_types[link_name]['id'] and self.direction == direction
-        return self.link_type == self.jira.link_types[link_name]['id']
+        return self.link.link_mask & self.jira.types.link_bit(link_name, direction) != 0
 
     @property
     def is_related(self) -> bool:
@@ -54,7 +48,8 @@ class JiraLink(JiraBase):
 
     @property
     def is_defined_by(self) -> bool:
-        return self.is_link('defines', JiraLinkDirection.INWARD)
+        # either direction, as JiraIssue.defined_by
+        return self.is_link('defines', None)
 
     @property
     def defines(self) -> bool:
@@ -62,7 +57,8 @@ class JiraLink(JiraBase):
 
     @property
     def is_mitigated_by(self) -> bool:
-        return self.is_link('mitigates', JiraLinkDirection.INWARD)
+        # either direction, as JiraIssue.mitigated_by
+        return self.is_link('mitigates', None)
 
     @property
     def mitigates(self) -> bool:
@@ -73,4 +69,8 @@ class JiraLink(JiraBase):
         return self.jira.get_issue(self.key, self.issue_class)
 
     def __getattr__(self, name: str):
+        if name.startswith('__') or name in [ 'link', 'record', 'jira' ]: # not set yet, or looked up by copy and pickle
+            raise AttributeError(name)
+        if 'full_issue' not in self.__dict__:
+            self.jira.resolve_link(self, name)
         return getattr(self.full_issue, name)
@@ -0,0 +1,63 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from typing import Iterable, List
+
+from .link import JiraLink
+from .link_dir import JiraLinkDirection
+
+class JiraLinkGraph():
+    """
+    Adjacency index of the Jira issue links, keyed by (issue key, link type id, direction)
+
+    The links of an issue are parsed the first time they are asked for, and the issues they resolve to are looked up
+    once per relationship, so that issues the reports never reach are never loaded from the cache.
+    The returned lists are shared between callers, and must not be modified.
+    """
+    def __init__(self, jira):
+        self.jira = jira
+        self.issue_links = { } # key -> [ JiraLink ], in Jira order
+        self.edges = { } # (key, link type id, direction) -> [ JiraLink ]
+        self.neighbours = { } # (key, link type id, direction) or (key, issue type name) -> [ JiraIssue ]
+
+    def index(self, issue) -> List[JiraLink]:
+        links = self.issue_links.get(issue.key)
+        if links is None:
+            links = [ JiraLink(link, self.jira) for link in issue.record.links ]
+            self.issue_links[issue.key] = links
+            for link in links:
+                self.edges.setdefault((issue.key, link.link_type, link.direction), [ ]).append(link)
+                self.edges.setdefault((issue.key, link.link_type, None), [ ]).append(link)
+        return links
+
+    def links(self, issue) -> List[JiraLink]:
+        return self.index(issue)
+
+    def resolve(self, links: Iterable[JiraLink]) -> list:
+        return [ self.jira.get_issue(link.key, link.issue_class) for link in links ]
+
+    def linked(self, issue, type_name: str = None) -> list:
+        """
+        Issues linked to the issue, all of them or those of the named issue type (from the issue_types mapping)
+        """
+        neighbour_key = (issue.key, type_name)
+        neighbours = self.neighbours.get(neighbour_key)
+        if neighbours is None:
+            links = self.index(issue) if type_name is None else self.jira.types.filter(self.index(issue), type_name)
+            neighbours = self.resolve(links)
+            self.neighbours[neighbour_key] = neighbours
+        return neighbours
+
+    def related(self, issue, link_name: str, direction: JiraLinkDirection = None) -> list:
+        """
+        Issues linked to the issue with the named link type (from the link_types mapping), in the given
+        direction or in both directions
+        """
+        neighbour_key = (issue.key, self.jira.link_types[link_name]['id'], direction)
+        neighbours = self.neighbours.get(neighbour_key)
+        if neighbours is None:
+            self.index(issue)
+            neighbours = self.resolve(self.edges.get(neighbour_key, [ ]))
+            self.neighbours[neighbour_key] = neighbours
+        return neighbours
@@ -0,0 +1,27 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+import functools
+
+def memoized_property(method):
+    """
+    Property of a Jira issue computed once and memoized on the issue, until the generation of its
+    JiraHelper changes (when the issue data is refreshed). The memoized value is shared between callers.
+    """
+    name = method.__qualname__
+
+    @property
+    @functools.wraps(method)
+    def memoized(self):
+        jira = self.jira
+        memo = self.memo.get(name)
+        if memo is not None and memo[0] == jira.generation:
+            jira.memo_reused[name] += 1
+            return memo[1]
+        value = method(self)
+        self.memo[name] = (jira.generation, value)
+        jira.memo_computed[name] += 1
+        return value
+
+    return memoized
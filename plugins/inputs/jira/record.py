@@ -0,0 +1,72 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from sys import intern
+from typing import Iterable, Tuple
+
+from .link_dir import JiraLinkDirection
+from .types import JiraTypes
+
+def name(value: dict) -> str:
+    return intern(value['name']) if value else ''
+
+def names(values: list) -> Tuple[str, ...]:
+    return tuple(intern(value['name']) for value in values or [ ])
+
+class JiraRecord():
+    """
+    Compact Jira issue, decoded once from the REST issue JSON
+
+    Keeps only the standard fields the model classes read, the custom fields of the fields mapping (by field id)
+    and the rendered fields the reports use, along with the issue type flags (see JiraTypes). Repeated strings
+    such as project keys, statuses and issue type icons are interned, so all the issues share them.
+    """
+    __slots__ = ('key', 'project_key', 'type', 'type_mask', 'icon', 'status', 'status_category', 'priority', 'summary', 'resolution',
+        'description', 'fix_versions', 'affects_versions', 'components', 'links', 'custom', 'rendered')
+
+    @classmethod
+    def decode(cls, issue: dict, types: JiraTypes, custom_ids: Iterable[str], rendered_ids: Iterable[str]) -> 'JiraRecord':
+        fields = issue.get('fields') or { }
+        rendered = issue.get('renderedFields') or { }
+        record = cls()
+        record.key = issue['key']
+        record.project_key = intern(record.key.split('-')[0])
+        record.type = int(fields['issuetype']['id'])
+        record.type_mask = types.issue_mask(record.type, record.project_key)
+        record.icon = intern(fields['issuetype']['iconUrl'])
+        status = fields.get('status') or { }
+        record.status = intern(status.get('name', ''))
+        record.status_category = intern(status['statusCategory']['name']) if 'statusCategory' in status else ''
+        record.priority = name(fields.get('priority'))
+        record.summary = fields.get('summary')
+        record.resolution = name(fields.get('resolution'))
+        record.description = fields.get('description')
+        record.fix_versions = names(fields.get('fixVersions'))
+        record.affects_versions = names(fields.get('versions'))
+        record.components = names(fields.get('components'))
+        record.links = tuple(JiraLinkRecord.decode(link, types, custom_ids, rendered_ids) for link in fields.get('issuelinks') or [ ])
+        record.custom = { field_id: fields[field_id] for field_id in custom_ids if fields.get(field_id) is not None } or None
+        record.rendered = { field_id: rendered[field_id] for field_id in rendered_ids if rendered.get(field_id) } or None
+        return record
+
+class JiraLinkRecord():
+    """
+    Compact Jira issue link, with the linked issue as it is embedded in the link
+    """
+    __slots__ = ('link_type', 'direction', 'link_mask', 'issue')
+
+    @classmethod
+    def decode(cls, link: dict, types: JiraTypes, custom_ids: Iterable[str], rendered_ids: Iterable[str]) -> 'JiraLinkRecord':
+        record = cls()
+        record.link_type = int(link['type']['id'])
+        if 'inwardIssue' in link:
+            record.direction = JiraLinkDirection.INWARD
+            record.issue = JiraRecord.decode(link['inwardIssue'], types, custom_ids, rendered_ids)
+        elif 'outwardIssue' in link:
+            record.direction = JiraLinkDirection.OUTWARD
+            record.issue = JiraRecord.decode(link['outwardIssue'], types, custom_ids, rendered_ids)
+        else:
+            raise NotImplementedError
+        record.link_mask = types.link_mask(record.link_type, record.direction)
+        return record
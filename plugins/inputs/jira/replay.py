@@ -0,0 +1,159 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from urllib.parse import urlsplit, parse_qsl
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PATH = '/rest/api/2/search'
+PAGE_PARAMS = [ 'startAt', 'maxResults' ]
+KEPT_HEADERS = [ 'Content-Type', 'ETag', 'Last-Modified' ]
+
+def recording_key(request) -> str:
+    """
+    Identifies a request independently of the Jira host, and of the page for searches,
+    so that recordings replay against any base URL and page size
+    """
+    url = urlsplit(request.url)
+    params = parse_qsl(url.query, keep_blank_values = True)
+    if url.path.endswith(SEARCH_PATH):
+        params = [ (name, value) for name, value in params if name not in PAGE_PARAMS ]
+    return f"{request.method} {url.path}?{'&'.join(f'{name}={value}' for name, value in sorted(params))}"
+
+def page_params(request) -> dict:
+    return dict(parse_qsl(urlsplit(request.url).query))
+
+class Recordings():
+    """
+    Jira responses in the recording folder, one JSON file per request
+
+    Search results are stored as the complete, ordered list of issues of the query, merged from all
+    the recorded pages, rather than page by page.
+    """
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok = True)
+
+    def filename(self, key: str) -> str:
+        return os.path.join(self.folder, f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json")
+
+    def read(self, key: str) -> dict:
+        try:
+            with open(self.filename(key), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write(self, key: str, recording: dict) -> None:
+        with open(self.filename(key), 'w') as f:
+            json.dump({ 'key': key, **recording }, f, indent = 4)
+
+    def record(self, request, response) -> None:
+        key = recording_key(request)
+        headers = { name: response.headers[name] for name in KEPT_HEADERS if name in response.headers }
+        with self.lock:
+            if urlsplit(request.url).path.endswith(SEARCH_PATH) and response.status_code == 200:
+                page = response.json()
+                recording = self.read(key) or { 'status': 200, 'headers': headers, 'issues': [ ] }
+                start = int(page['startAt'])
+                issues = recording['issues']
+                issues.extend([ None ] * (int(page['total']) - len(issues)))
+                issues[start:start + len(page['issues'])] = page['issues']
+                del issues[int(page['total']):]
+                self.write(key, recording)
+            else:
+                self.write(key, { 'status': response.status_code, 'reason': response.reason, 'headers': headers, 'body': response.text })
+        logger.debug(f"recorded {key}")
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    Transport adapter that saves every Jira response into the recording folder
+    """
+    def __init__(self, recordings: Recordings, **kwargs):
+        super().__init__(**kwargs)
+        self.recordings = recordings
+
+    def send(self, request, *args, **kwargs):
+        response = super().send(request, *args, **kwargs)
+        if response.status_code not in [ 304, 429, 503 ]: # not modified, and the statuses the session retries
+            self.recordings.record(request, response)
+        return response
+
+class ReplayAdapter(HTTPAdapter):
+    """
+    Transport adapter that serves recorded Jira responses instead of sending requests
+
+    Each response is delayed by the configured latency (with jitter), and searches are paged with at most
+    `page_size` issues per page, whatever page size the recording was made with. Requests that were not
+    recorded get a 404 response.
+    """
+    def __init__(self, recordings: Recordings, latency: float, jitter: float, page_size: int, **kwargs):
+        super().__init__(**kwargs)
+        self.recordings = recordings
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+
+    def send(self, request, *args, **kwargs):
+        key = recording_key(request)
+        recording = self.recordings.read(key)
+        delay = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if delay:
+            time.sleep(delay)
+        if recording is None:
+            logger.warning(f"no recording for {key}")
+            return self.response(request, 404, 'Not Found', { 'Content-Type': 'application/json' }, json.dumps({ 'errorMessages': [ 'not recorded' ] }))
+        headers = recording['headers']
+        etag = request.headers.get('If-None-Match')
+        modified = request.headers.get('If-Modified-Since')
+        if (etag and etag == headers.get('ETag')) or (modified and modified == headers.get('Last-Modified')):
+            return self.response(request, 304, 'Not Modified', headers, '')
+        if 'issues' in recording:
+            return self.response(request, 200, 'OK', headers, json.dumps(self.page(recording['issues'], page_params(request))))
+        return self.response(request, recording['status'], recording['reason'], headers, recording['body'])
+
+    def page(self, issues: list, params: dict) -> dict:
+        issues = [ issue for issue in issues if issue is not None ]
+        start = int(params.get('startAt', 0))
+        count = min(int(params.get('maxResults', self.page_size)), self.page_size)
+        return { 'startAt': start, 'maxResults': count, 'total': len(issues), 'issues': issues[start:start + count] }
+
+    @staticmethod
+    def response(request, status: int, reason: str, headers: dict, body: str) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = 'utf-8'
+        response._content = body.encode('utf-8') # pylint: disable=protected-access
+        response.url = request.url
+        response.request = request
+        return response
+
+def transport_adapter(config: dict, **kwargs) -> HTTPAdapter:
+    """
+    Transport adapter for the `replay` mode in the Jira configuration: `off`, `record` or `replay`
+    """
+    mode = str(config['mode']).lower()
+    if mode in [ 'off', 'false' ]:
+        return HTTPAdapter(**kwargs)
+    recordings = Recordings(config['folder'])
+    if mode == 'record':
+        logger.info(f"recording Jira responses into {config['folder']}")
+        return RecordingAdapter(recordings, **kwargs)
+    if mode == 'replay':
+        logger.info(f"replaying Jira responses from {config['folder']}")
+        return ReplayAdapter(recordings, float(config['latency']), float(config['jitter']), int(config['page_size']), **kwargs)
+    raise ValueError(f"unknown replay mode '{config['mode']}', expected one of off, record, replay")
@@ -3,17 +3,19 @@ Copyright (c) 2020, Tidepool Project
 All rights reserved.
 """
 import logging
+from functools import cached_property
 from typing import List
 
 from .issue import JiraIssue
 from .risk_score import JiraRiskScore
+from .memo import memoized_property
 
 logger = logging.getLogger(__name__)
 
 class JiraRisk(JiraIssue):
     @property
     def source(self):
-        return self.fields.get(self.jira.fields['source']) or ''
+        return self.field('source') or ''
 
     @property
     def sequence(self):
@@ -21,7 +23,7 @@ class JiraRisk(JiraIssue):
 
     @property
     def hazard(self):
-        return self.fields.get(self.jira.fields['hazard']) or ''
+        return self.field('hazard') or ''
 
     @property
     def hazard_category(self):
@@ -29,7 +31,7 @@ class JiraRisk(JiraIssue):
 
     @property
     def harm(self):
-        return self.fields.get(self.jira.fields['harm']) or ''
+        return self.field('harm') or ''
 
     @property
     def initial_severity(self):
@@ -59,15 +61,15 @@ class JiraRisk(JiraIssue):
     def benefit(self):
         return self.format_value('benefit')
 
-    @property
-    def stories(self):
-        return [ self.jira.get_issue(link.key, link.issue_class) for link in self.links if link.is_story ]
+    @cached_property
+    def harm_order(self) -> str:
+        return f'{self.harm}:{self.hazard_category}'
 
     def format_value(self, key):
-        return self.rendered_fields.get(self.jira.fields[key]) or ''
+        return self.rendered_field(key) or ''
 
     def format_weighted_value(self, key):
-        val = self.fields.get(self.jira.fields[key])
+        val = self.field(key)
         if val:
             return f"{val['value']} ({self.jira.get_weight(key, val['id'])})"
         return ''
@@ -96,7 +98,7 @@ class JiraRisk(JiraIssue):
             return 'red'
         return ''
 
-    @property
+    @memoized_property
     def mitigations(self) -> List[JiraIssue]:
         mitigations = set() # only list unique mitigations
         logger.debug(f'examining {self.key} links: {",".join([ link.key for link in self.links ])}')
@@ -0,0 +1,149 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import re
+import time
+import asyncio
+import random
+import logging
+import threading
+import requests
+
+from .replay import transport_adapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = [ 429, 503 ] # Too Many Requests, Service Unavailable
+
+def retry_delay(retry_after: str, attempt: int, backoff: float, max_backoff: float) -> float:
+    if retry_after:
+        try:
+            return min(max_backoff, max(0.0, float(retry_after)))
+        except ValueError:
+            try:
+                return min(max_backoff, max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()))
+            except (TypeError, ValueError):
+                pass
+    # exponential backoff with jitter, so that parallel workers don't retry in lockstep
+    return min(max_backoff, backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+class TokenBucket():
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> float:
+        # takes a token and returns 0, or returns how long to wait for the next one
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self) -> None:
+        while True:
+            delay = self.take()
+            if not delay:
+                return
+            time.sleep(delay)
+
+    async def acquire_async(self) -> None:
+        # same bucket, waited for on the event loop instead of blocking its thread
+        while True:
+            delay = self.take()
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+class RequestStats():
+    def __init__(self):
+        self.count = 0
+        self.retries = 0
+        self.bytes = 0
+        self.waited = 0.0
+        self.server = 0.0
+        self.client = 0.0
+
+    def __str__(self) -> str:
+        count = self.count or 1
+        return (f"{self.count} requests, {self.retries} retries, {self.bytes} bytes, "
+            f"average server {self.server / count:.3f}s, client {self.client / count:.3f}s, waited {self.waited / count:.3f}s")
+
+class JiraSession(requests.Session):
+    """
+    HTTP session for the Jira REST API with a tuned connection pool, a global cap on requests in flight,
+    a token bucket rate limit, and retries with exponential backoff that honour Retry-After.
+    Responses can be recorded, or replayed instead of sending the requests, as set in `replay`.
+    """
+    def __init__(self, config: dict, replay: dict):
+        super().__init__()
+        pool_size = int(config['pool_size'])
+        adapter = transport_adapter(replay, pool_connections = pool_size, pool_maxsize = pool_size, pool_block = True)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        if not config['keep_alive']:
+            self.headers['Connection'] = 'close'
+        self.concurrency = threading.BoundedSemaphore(int(config['concurrency']))
+        rate = float(config['rate'])
+        self.bucket = TokenBucket(rate, int(config['burst'])) if rate > 0 else None
+        self.retries = int(config['retries'])
+        self.backoff = float(config['backoff'])
+        self.max_backoff = float(config['max_backoff'])
+        self.stats = { }
+        self.stats_lock = threading.Lock()
+
+    def request(self, method, url, *args, **kwargs):
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            if self.bucket:
+                self.bucket.acquire()
+            with self.concurrency:
+                sent = time.perf_counter()
+                response = super().request(method, url, *args, **kwargs)
+                _ = response.content # read the body while holding the slot, so client time includes the download
+                done = time.perf_counter()
+            self.record(method, url, response, attempt > 0, sent - start, response.elapsed.total_seconds(), done - sent)
+            if response.status_code not in RETRY_STATUS or attempt >= self.retries:
+                return response
+            delay = self.retry_delay(response, attempt)
+            logger.warning(f"{method} {self.endpoint(url)} returned {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def retry_delay(self, response, attempt: int) -> float:
+        return retry_delay(response.headers.get('Retry-After'), attempt, self.backoff, self.max_backoff)
+
+    @staticmethod
+    def endpoint(url: str) -> str:
+        # group the statistics by endpoint rather than by individual issue or field
+        path = re.sub(r'/[A-Z][A-Z0-9_]*-\d+', '/{issue}', urlsplit(url).path)
+        return re.sub(r'/field/[^/]+/', '/field/{field}/', path)
+
+    def record(self, method: str, url: str, response, retry: bool, waited: float, server: float, total: float) -> None:
+        path = self.endpoint(url)
+        client = max(0.0, total - server)
+        logger.debug(f"{method} {path} {response.status_code} {len(response.content)} bytes in {total:.3f}s (server {server:.3f}s, client {client:.3f}s, waited {waited:.3f}s)")
+        with self.stats_lock:
+            stats = self.stats.setdefault(path, RequestStats())
+            stats.count += 1
+            stats.retries += int(retry)
+            stats.bytes += len(response.content)
+            stats.waited += waited
+            stats.server += server
+            stats.client += client
+
+    def log_stats(self, level: int = logging.INFO) -> None:
+        with self.stats_lock:
+            for path, stats in sorted(self.stats.items()):
+                logger.log(level, f"{path}: {stats}")
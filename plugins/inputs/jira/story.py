@@ -10,24 +10,24 @@ logger = logging.getLogger(__name__)
 class JiraStory(JiraIssue):
     @property
     def requirements(self):
-        return self.rendered_fields.get(self.jira.fields['functional_requirements']) or self.raw_requirements
+        return self.rendered_field('functional_requirements') or self.raw_requirements
 
     @property
     def raw_requirements(self):
-        return self.markdown.convert(self.fields.get(self.jira.fields['functional_requirements'], ''))
+        return self.jira.markdown.convert(self.field('functional_requirements') or '')
 
     @property
     def done_criteria(self):
-        return self.rendered_fields.get(self.jira.fields['done_criteria']) or self.raw_done_criteria
+        return self.rendered_field('done_criteria') or self.raw_done_criteria
 
     @property
     def raw_done_criteria(self):
-        return self.markdown.convert(self.fields.get(self.jira.fields['done_criteria'], ''))
+        return self.jira.markdown.convert(self.field('done_criteria') or '')
 
     @property
     def test_strategy(self):
-        return self.rendered_fields.get(self.jira.fields['test_strategy']) or self.raw_test_strategy
+        return self.rendered_field('test_strategy') or self.raw_test_strategy
 
     @property
     def raw_test_strategy(self):
-        return self.markdown.convert(self.fields.get(self.jira.fields['test_strategy'], ''))
+        return self.jira.markdown.convert(self.field('test_strategy') or '')
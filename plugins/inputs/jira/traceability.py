@@ -0,0 +1,95 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from typing import Iterable, NamedTuple, Optional, Tuple
+import logging
+
+from .issue import JiraIssue
+
+logger = logging.getLogger(__name__)
+
+class TraceRules(NamedTuple):
+    """
+    Issues an output traces from each requirement, and how it filters them: None for no junk filter,
+    otherwise the enforce_versions argument of exclude_junk
+    """
+    requirement_junk: Optional[bool]
+    story_links: str # requirement property: 'defines' for the stories it defines, 'stories' for any linked story
+    story_junk: Optional[bool]
+    test_junk: Optional[bool]
+    risk_junk: Optional[bool]
+
+# the rules each output has been following, by output key; outputs with the same rules share one closure
+TRACE_RULES = {
+    'excel': TraceRules(requirement_junk = False, story_links = 'defines', story_junk = True, test_junk = None, risk_junk = False),
+    'html': TraceRules(requirement_junk = False, story_links = 'stories', story_junk = True, test_junk = True, risk_junk = False),
+    'd3js': TraceRules(requirement_junk = False, story_links = 'stories', story_junk = True, test_junk = False, risk_junk = False),
+    'graphviz': TraceRules(requirement_junk = None, story_links = 'stories', story_junk = None, test_junk = None, risk_junk = None),
+}
+
+class StoryTrace(NamedTuple):
+    """
+    Development story that implements a requirement, with the tests that verify it, sorted by issue key
+    """
+    story: JiraIssue
+    tests: Tuple[JiraIssue, ...]
+    verified: bool # story done, or any of its tests done
+
+class RequirementTrace(NamedTuple):
+    """
+    Functional requirement, traced to its stories and to the risks it mitigates directly or through those stories
+    """
+    requirement: JiraIssue
+    stories: Tuple[StoryTrace, ...]
+    risks: Tuple[JiraIssue, ...]
+    verified: bool # any story verified
+    device_qualification: bool # no stories, to be verified with the device in the future
+
+    @property
+    def key(self) -> str:
+        return self.requirement.key
+
+    @property
+    def id(self) -> str:
+        return self.requirement.id
+
+class Traceability(NamedTuple):
+    """
+    Traceability of the functional requirements, sorted by requirement ID
+    """
+    requirements: Tuple[RequirementTrace, ...]
+
+    @property
+    def verified(self) -> int:
+        return sum(1 for req in self.requirements if req.verified and not req.device_qualification)
+
+    @property
+    def future(self) -> int:
+        return sum(1 for req in self.requirements if req.device_qualification)
+
+def without_junk(jira, issues: Iterable, enforce_versions: Optional[bool]) -> list:
+    return list(issues) if enforce_versions is None else jira.exclude_junk(issues, enforce_versions = enforce_versions)
+
+def trace_requirements(jira, rules: TraceRules) -> Traceability:
+    """
+    Compute the traceability closure once for a set of rules (the Excel rules are in the README)
+    """
+    logger.info('computing traceability')
+    logger.debug(f'traceability rules: {rules}')
+    requirements = [ ]
+    if rules.requirement_junk is False: # the pre-sorted view
+        func_requirements = jira.sorted_func_requirements
+    else:
+        func_requirements = jira.sorted_by_id(without_junk(jira, jira.func_requirements.values(), rules.requirement_junk))
+    for req in func_requirements:
+        stories = [ ]
+        for story in jira.sorted_by_key(without_junk(jira, getattr(req, rules.story_links), rules.story_junk)):
+            tests = tuple(jira.sorted_by_key(without_junk(jira, story.tests, rules.test_junk)))
+            stories.append(StoryTrace(story, tests, story.is_done or any(test.is_done for test in tests)))
+        risks = tuple(jira.sorted_by_key(without_junk(jira, req.risks, rules.risk_junk)))
+        device_qualification = bool(req.is_device_qualification) and not stories
+        requirements.append(RequirementTrace(req, tuple(stories), risks, any(story.verified for story in stories), device_qualification))
+    traceability = Traceability(tuple(requirements))
+    logger.info(f'traced {len(traceability.requirements)} requirements, {traceability.verified} verified, {traceability.future} to be verified in the future')
+    return traceability
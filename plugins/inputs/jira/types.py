@@ -0,0 +1,67 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from typing import Iterable, List
+
+from .link_dir import JiraLinkDirection
+
+# classes that links resolve to, in order of precedence, by issue type name
+ISSUE_CLASSES = [ ('story', 'JiraStory'), ('risk', 'JiraRisk'), ('func_requirement', 'JiraFuncRequirement'), ('instruction', 'JiraInstruction'), ('test', 'JiraTest'), ('bug', 'JiraBug') ]
+
+class JiraTypes():
+    """
+    Issue types and link types of the Jira configuration, resolved into integer bit flags
+
+    Every issue type name in `issue_types` gets a bit, and every issue gets the mask of all the names whose type IDs
+    and projects it matches (story and risk share type IDs, for instance). Likewise, every link type name in
+    `link_types` gets a bit per direction, and every link gets the mask of its link type ID and direction.
+    Type tests then become a bitwise AND against the mask, which is computed once when the issue is loaded.
+    """
+    def __init__(self, issue_types: dict, link_types: dict):
+        self.issue_bits = { name: 1 << index for index, name in enumerate(issue_types) }
+        self.issue_masks = { }
+        for name, issue_type in issue_types.items():
+            for type_id in issue_type['ids']:
+                for project in issue_type['projects']:
+                    self.issue_masks[(int(type_id), project)] = self.issue_masks.get((int(type_id), project), 0) | self.issue_bits[name]
+        self.link_bits = { }
+        self.link_masks = { }
+        for index, name in enumerate(link_types):
+            for direction in JiraLinkDirection:
+                bit = 1 << (2 * index + direction)
+                self.link_bits[(name, direction)] = bit
+                link_key = (int(link_types[name]['id']), direction)
+                self.link_masks[link_key] = self.link_masks.get(link_key, 0) | bit
+        self.issue_classes = { }
+
+    def issue_mask(self, type_id: int, project_key: str) -> int:
+        return self.issue_masks.get((type_id, project_key), 0)
+
+    def link_mask(self, link_type: int, direction: JiraLinkDirection) -> int:
+        return self.link_masks.get((link_type, direction), 0)
+
+    def issue_bit(self, *type_names: str) -> int:
+        mask = 0
+        for type_name in type_names:
+            mask |= self.issue_bits[type_name]
+        return mask
+
+    def link_bit(self, link_name: str, direction: JiraLinkDirection = None) -> int:
+        if direction is None: # either direction
+            return self.link_bits[(link_name, JiraLinkDirection.INWARD)] | self.link_bits[(link_name, JiraLinkDirection.OUTWARD)]
+        return self.link_bits[(link_name, direction)]
+
+    def issue_class(self, mask: int) -> str:
+        issue_class = self.issue_classes.get(mask)
+        if issue_class is None:
+            issue_class = next((issue_class for type_name, issue_class in ISSUE_CLASSES if mask & self.issue_bits[type_name]), 'JiraIssue')
+            self.issue_classes[mask] = issue_class
+        return issue_class
+
+    def filter(self, issues: Iterable, *type_names: str) -> List:
+        """
+        Issues of any of the named issue types
+        """
+        mask = self.issue_bit(*type_names)
+        return [ issue for issue in issues if issue.type_mask & mask ]
@@ -3,13 +3,14 @@ Copyright (c) 2020, Tidepool Project
 All rights reserved.
 """
 from .issue import JiraIssue
+from .memo import memoized_property
 
 class JiraUserRequirement(JiraIssue):
     @property
     def id(self):
-        return self.fields[self.jira.fields['reference_id']] or ''
+        return self.field('reference_id') or ''
 
-    @property
+    @memoized_property
     def risks(self):
         all = set(super().risks)
         # aggregate indirect risks from linked stories
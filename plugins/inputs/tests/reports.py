@@ -4,7 +4,6 @@ All rights reserved.
 """
 import os
 import logging
-import time
 from functools import cached_property
 from typing import List
 import boto3
@@ -12,6 +11,7 @@ from botocore import UNSIGNED
 from botocore.config import Config
 
 import plugins.input
+from plugins.cache import create_cache
 from .report import TestReport
 
 logger = logging.getLogger(__name__)
@@ -22,10 +22,7 @@ class TestReports(plugins.input.InputSource):
 
     def __init__(self, config):
         super().__init__(config)
-        self.cache_folder = self.config['cache']['folder']
-        self.cache_ignore = self.config['refresh_cache']
-        os.makedirs(self.cache_folder, exist_ok = True)
-        self.cache_refresh = int(self.config['cache']['refresh'])
+        self.cache = create_cache(self.config['cache'], self.key, ignore = self.config['refresh_cache'], text = True)
         config = Config(
             region_name = self.config['reports']['region'],
             signature_version = UNSIGNED,
@@ -82,19 +79,14 @@ class TestReports(plugins.input.InputSource):
         self.write_cache(key, content)
         return TestReport(content)
 
-    def read_cache(self, cache_key: str) -> dict:
-        if self.cache_ignore:
-            return None
-        cache_file = os.path.join(self.cache_folder, cache_key)
-        if os.path.exists(cache_file):
-            if os.stat(cache_file).st_mtime + self.cache_refresh >= time.time():
-                logger.debug(f"reading {cache_key} from cache file {cache_file}")
-                with open(cache_file, 'r') as f:
-                    return TestReport(f.read())
+    def read_cache(self, cache_key: str) -> TestReport:
+        content = self.cache.read(cache_key)
+        if content:
+            return TestReport(content)
         return None
 
-    def write_cache(self, cache_key: str, content) -> dict:
-        cache_file = os.path.join(self.cache_folder, cache_key)
-        with open(cache_file, 'w') as f:
-            logger.debug(f"writing {cache_key} into cache file {cache_file}")
-            f.write(content)
+    def write_cache(self, cache_key: str, content: str) -> None:
+        self.cache.write(cache_key, content)
+
+    def close(self) -> None:
+        self.cache.close()
@@ -74,16 +74,16 @@ class D3js(plugins.output.OutputGenerator):
     @cached_property
     def nodes(self):
         root_node = Node('Tidepool Loop v1.0')
-        for req in self.jira.sorted_by_id(self.jira.exclude_junk(self.jira.func_requirements.values(), enforce_versions = False)):
-            req_node = root_node.add_child(req)
-            for risk in self.jira.sorted_by_key(self.jira.exclude_junk(req.risks, enforce_versions = False)):
+        for trace in self.jira.traceability(self.key).requirements:
+            req_node = root_node.add_child(trace.requirement)
+            for risk in trace.risks:
                 risk_node = req_node.add_child(risk)
                 # for mitigation in self.jira.sorted_by_key(self.jira.exclude_junk(risk.mitigations, enforce_versions = False)):
                 #     risk_node.add_child(mitigation.key)
 
-            for story in self.jira.sorted_by_key(self.jira.exclude_junk(req.stories, enforce_versions = True)):
-                story_node = req_node.add_child(story)
-                for test in self.jira.sorted_by_key(self.jira.exclude_junk(story.tests, enforce_versions = False)):
+            for story in trace.stories:
+                story_node = req_node.add_child(story.story)
+                for test in story.tests:
                     story_node.add_child(test)
 
         return json.dumps(root_node, indent = 4)
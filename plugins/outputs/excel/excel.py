@@ -2,14 +2,18 @@
 Copyright (c) 2020, Tidepool Project
 All rights reserved.
 """
+import copy
 import logging
-from typing import Tuple, List
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
 from operator import attrgetter
 import openpyxl
-import re
-import ast
 
-from .html import HtmlToExcel
+from .html import HtmlConverter
+from .template import TemplatePlan, Insertion
+from .writer import WRITERS, BufferedWriter, RecordingWriter, SheetModel
 from .column import Column
 from .columns import Columns
 import plugins.output
@@ -20,6 +24,20 @@ logger = logging.getLogger(__name__)
 def log_issue(issue, indent: int = 0):
     logger.debug(f"{indent * '--> '}added {issue.type} {issue.key} {issue.url}")
 
+# the Excel output generating the report, inherited by the forked worker processes along with the Jira model
+generator = None
+
+def record_insertion(title: str, step: Insertion) -> Tuple[SheetModel, int, int]:
+    # runs in a worker process, which records several insertions in turn, each with its own writer on a copy of
+    # the generator: the template sheet only provides the title and dimensions
+    excel = copy.copy(generator)
+    sheet = excel.writer.template[title]
+    excel.writer = RecordingWriter()
+    excel.html.hits = excel.html.misses = 0
+    getattr(excel.__class__, step.method)(excel, sheet, step.row, step.column, props = dict(step.props))
+    excel.writer.close_sheet(sheet)
+    return excel.writer.model(sheet), excel.html.hits, excel.html.misses
+
 class Excel(plugins.output.OutputGenerator):
     key = 'excel'
     flag = '--excel'
@@ -59,10 +77,13 @@ class Excel(plugins.output.OutputGenerator):
         output_file = self.config['output']['report']
         logger.info(f"generating {output_file} from {template_file}")
 
-        book = openpyxl.load_workbook(template_file)
+        writer = self.config.get('writer', 'workbook')
+        if writer not in WRITERS:
+            raise ValueError(f"unknown Excel writer '{writer}', expected one of {', '.join(WRITERS)}")
+        # writes are buffered, and applied in batches
+        self.writer = BufferedWriter(WRITERS[writer](template_file, [ self.create_format(format_key, format) for format_key, format in self.config['formats'].items() ]))
 
-        for format_key, format in self.config['formats'].items():
-            book.add_named_style(self.create_format(format_key, format))
+        self.html = HtmlConverter(int(self.config.get('html', { }).get('cache_size', 1024)))
 
         self.risk_formats = {
             JiraRiskScore.GREEN: 'low_risk',
@@ -71,33 +92,58 @@ class Excel(plugins.output.OutputGenerator):
             JiraRiskScore.UNKNOWN: 'unknown_risk',
         }
 
-        for sheet in book.worksheets:
-            logger.info(f"examining sheet '{sheet.title}'")
-            for row in sheet.iter_rows():
-                for cell in row:
-                    # substitution?
-                    if re.search(r'\{.+\}', str(cell.value)):
-                        text = self.format_text(cell.value)
-                        logger.info(f"replacing '{cell.value}' with '{text}'")
-                        cell.value = text
-                    # insertion?
-                    insertion = re.search(r'<<<insert: (\w+)\((.*)\)>>>', str(cell.value))
-                    if insertion:
-                        generator_method = getattr(self.__class__, insertion.group(1))
-                        props = { }
-                        if insertion.group(2):
-                            logger.debug(f"parsing {insertion.group(2)}")
-                            props = ast.literal_eval('{' + insertion.group(2) + '}')
-                            logger.debug(f"got {props}")
-                        generator_method(self, sheet, cell.row, cell.column, props = props)
+        plan = TemplatePlan.compile(template_file, self.writer.template)
+        workers = int(self.config.get('workers', 1))
+        with self.record_insertions(plan, workers) as models:
+            for sheet in self.writer.sheets:
+                logger.info(f"examining sheet '{sheet.title}'")
+                self.set_outline_properties(sheet)
+                for index, step in enumerate(plan.steps(sheet)):
+                    if not step.is_insertion:
+                        text = self.format_text(step.text)
+                        logger.info(f"replacing '{step.text}' with '{text}'")
+                        self.writer.cell(sheet, step.row, step.column).value = text
+                    elif (sheet.title, index) in models:
+                        model, hits, misses = models[(sheet.title, index)].result()
+                        self.html.count(hits, misses)
+                        self.writer.apply(sheet, model)
+                        if model.print_title_rows:
+                            sheet.print_title_rows = model.print_title_rows
                     else:
-                        self.set_paper(sheet)
+                        getattr(self.__class__, step.method)(self, sheet, step.row, step.column, props = dict(step.props))
+                # page setup once the sheet is complete, for the print area to cover the inserted rows
+                self.set_paper(sheet)
+                self.writer.close_sheet(sheet)
 
-        book.save(output_file)
+        self.writer.save(output_file)
+        self.html.log_stats(logging.INFO if self.config['verbose'] else logging.DEBUG)
 
         logger.info(f"done generating {output_file}")
         return [ output_file ]
 
+    @contextmanager
+    def record_insertions(self, plan: TemplatePlan, workers: int) -> Iterator[Dict[Tuple[str, int], Future]]:
+        """
+        With more than one worker, record the rows of every insertion in a pool of forked processes, which share the
+        Jira model as it is at this point, and yield their future row models and HTML conversion counts by sheet title
+        and step index.
+        The rows are then written in this process, in sheet order.
+        """
+        if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            yield { }
+            return
+        global generator
+        generator = self
+        logger.info(f"recording insertions in {workers} worker processes")
+        try:
+            with ProcessPoolExecutor(max_workers = workers, mp_context = multiprocessing.get_context('fork')) as executor:
+                yield {
+                    (title, index): executor.submit(record_insertion, title, step)
+                    for title, steps in plan.sheets.items() for index, step in enumerate(steps) if step.is_insertion
+                }
+        finally:
+            generator = None
+
     #
     # Software Requirements
     #
@@ -107,7 +153,7 @@ class Excel(plugins.output.OutputGenerator):
         # requirements, sorted by requirement ID
         req_ids = { }
         row = start_row
-        for req in self.jira.sorted_by_id(self.jira.exclude_junk(self.jira.func_requirements.values(), enforce_versions = False)):
+        for req in self.jira.sorted_func_requirements:
             log_issue(req)
 
             col = start_col
@@ -117,6 +163,7 @@ class Excel(plugins.output.OutputGenerator):
             self.write_html(sheet, row, col + 3, req.description)
 
             row += 1
+            self.flush(sheet, row)
             # uniqueness check; requirement IDs should be globally unique
             if req.id in req_ids:
                 logger.warn(f"requirement ID '{req.id}' duplicated in: {', '.join([ *req_ids[req.id], req.key ])}")
@@ -147,24 +194,23 @@ class Excel(plugins.output.OutputGenerator):
             logger.info(f"filtering requirements by keys: {props['filter']}")
         if 'filter_id' in props:
             logger.info(f"filtering requirements by ID: {props['filter_id']}")
-        for req in self.jira.sorted_by_id(self.jira.exclude_junk(self.jira.filter_by_id(self.jira.filter_by_key(self.jira.func_requirements.values(), props.get('filter')), props.get('filter_id')), enforce_versions = False)):
+        if props.get('full') and props.get('filter_risks'):
+            logger.info(f"filtering risks by keys: {props['filter_risks']}")
+        for trace in self.jira.filter_by_id(self.jira.filter_by_key(self.jira.traceability(self.key).requirements, props.get('filter')), props.get('filter_id')):
+            req = trace.requirement
             log_issue(req)
             req_row = row
             col = start_col
 
             # stories, sorted by issue key
-            verified = False
             story_row = req_row
             story_col = col + 4
-            stories = self.jira.sorted_by_key(self.jira.exclude_junk(req.defines, enforce_versions = True))
-            for story in stories:
+            for story_trace in trace.stories:
+                story = story_trace.story
                 log_issue(story, 1)
 
                 # tests, sorted by issue key
-                test_row, tests_verified = self.write_tests(sheet, story_row, story_col + 2, story)
-
-                # update verification status
-                verified = verified or story.is_done or tests_verified
+                test_row = self.write_tests(sheet, story_row, story_col + 2, story, story_trace.tests)
 
                 # story summary, possibly across many rows
                 row = max(story_row + 1, test_row) - 1
@@ -172,22 +218,22 @@ class Excel(plugins.output.OutputGenerator):
                 self.set_outline(sheet, story_row, req_row, 1)
                 story_row = row + 1
 
-            if req.is_device_qualification and story_row == req_row: # there were no attached implementation stories?
+            if trace.device_qualification:
                 logger.info(f"{req.key} {req.id} '{req.summary}' is a device qualification requirement -> future verification")
                 self.write(sheet, story_row, story_col, self.labels['device_qual_req'], format = 'bold', end_col = story_col + 4)
                 total_future += 1
             else:
-                if verified:
+                if trace.verified:
                     total_verified += 1
                 else:
-                    if len(stories) > 0:
-                        logger.warn(f"{req.key} {req.id} '{req.summary}' has {len(stories)} linked stories that implement it, but none verify it")
+                    if len(trace.stories) > 0:
+                        logger.warn(f"{req.key} {req.id} '{req.summary}' has {len(trace.stories)} linked stories that implement it, but none verify it")
                     else:
                         logger.warn(f"{req.key} {req.id} '{req.summary}' has no linked stories that implement it")
 
             risk_row = req_row
             if props.get('full'): # include risks?
-                risk_row, mitigated = self.write_risks(sheet, risk_row, story_col + 6, req, filter = props.get('filter_risks'))
+                risk_row = self.write_risks(sheet, risk_row, story_col + 6, self.jira.filter_by_key(trace.risks, props.get('filter_risks')))
 
             row = max(req_row + 1, risk_row, story_row) - 1
             self.write_id(sheet, req_row, col, req, end_row = row)
@@ -196,6 +242,7 @@ class Excel(plugins.output.OutputGenerator):
             if props.get('full'):
                 self.merge(sheet, req_row, story_col + 5, end_row = row)
             row += 1
+            self.flush(sheet, row)
             total_requirements += 1
 
         # report.ignore_errors({ 'number_stored_as_text': xl_range(0, 0, row - 1, columns.last) })
@@ -214,7 +261,8 @@ class Excel(plugins.output.OutputGenerator):
         # requirements, sorted by requirement ID
         total_requirements = 0
         row = start_row
-        for req in self.jira.sorted_by_id(self.jira.exclude_junk(self.jira.func_requirements.values(), enforce_versions = False)):
+        for trace in self.jira.traceability(self.key).requirements:
+            req = trace.requirement
             log_issue(req)
             req_row = row
             col = start_col
@@ -222,7 +270,8 @@ class Excel(plugins.output.OutputGenerator):
             # stories, sorted by issue key
             story_row = req_row
             story_col = col + 4
-            for story in self.jira.sorted_by_key(self.jira.exclude_junk(req.defines, enforce_versions = True)):
+            for story_trace in trace.stories:
+                story = story_trace.story
                 log_issue(story, 1)
                 self.write_key_and_summary(sheet, story_row, story_col, story)
                 if story.is_done:
@@ -230,7 +279,7 @@ class Excel(plugins.output.OutputGenerator):
                 self.set_outline(sheet, story_row, req_row, 1)
                 story_row += 1
 
-            if req.is_device_qualification and story_row == req_row: # there were no attached implementation stories?
+            if trace.device_qualification:
                 logger.info(f"{req.key} {req.id} '{req.summary}' is a device qualification requirement -> future verification")
                 self.write(sheet, story_row, story_col, self.labels['device_qual_req'], format = 'bold', end_col = story_col + 2)
 
@@ -239,6 +288,7 @@ class Excel(plugins.output.OutputGenerator):
             self.write_key_and_summary(sheet, req_row, col + 1, req, end_row = row)
             self.write_html(sheet, req_row, col + 3, req.description, end_row = row)
             row += 1
+            self.flush(sheet, row)
             total_requirements += 1
 
         # report.ignore_errors({ 'number_stored_as_text': xl_range(0, 0, row - 1, columns.last) })
@@ -255,16 +305,13 @@ class Excel(plugins.output.OutputGenerator):
         # stories, sorted by issue key
         row = start_row
         col = start_col
-        stories = self.jira.sorted_by_key(self.jira.exclude_junk(self.jira.stories.values(), enforce_versions = True))
+        stories = self.jira.sorted_stories
         for story in stories:
             log_issue(story, 1)
             story_row = row
 
             # tests, sorted by issue key
-            test_row, tests_verified = self.write_tests(sheet, story_row, col + 2, story)
-
-            # update verification status
-            verified = story.is_done or tests_verified
+            test_row = self.write_tests(sheet, story_row, col + 2, story, self.jira.sorted_by_key(story.tests))
 
             # story summary, possibly across many rows
             row = max(story_row + 1, test_row) - 1
@@ -272,6 +319,7 @@ class Excel(plugins.output.OutputGenerator):
             self.set_outline(sheet, story_row, row, 1)
 
             row += 1
+            self.flush(sheet, row)
 
         logger.info(f"done adding report sheet '{sheet.title}'")
 
@@ -282,21 +330,16 @@ class Excel(plugins.output.OutputGenerator):
         logger.info(f"adding report sheet '{sheet.title}'")
 
         # risks, sorted by harm
-        total_risks = 0
-        total_initial_scores = self.jira.risk_scores
-        total_residual_scores = self.jira.risk_scores
-        row = start_row
         if 'filter' in props:
             logger.info(f"filtering risks by {props['filter']}")
-        for risk in self.jira.sorted_by_harm(self.jira.exclude_junk(self.jira.filter_by_key(self.jira.risks.values(), props.get('filter')), enforce_versions = False)):
+        risks = self.jira.filter_by_key(self.jira.sorted_risks, props.get('filter'))
+        scores, total_initial_scores, total_residual_scores = self.score_risks(risks)
+        self.write_risk_summary(sheet, 1, len(risks), total_initial_scores, start_col + 9, total_residual_scores, start_col + 15)
+        row = start_row
+        for risk, (initial_risk_score, residual_risk_score) in zip(risks, scores):
             log_issue(risk)
             risk_row = row
             col = start_col
-            total_risks += 1
-            initial_risk_score = risk.score(risk.initial_risk, 'initial')
-            total_initial_scores[initial_risk_score] += 1
-            residual_risk_score = risk.score(risk.residual_risk, 'residual')
-            total_residual_scores[residual_risk_score] += 1
 
             # list all mitigations in the sheet
             story_row = row
@@ -327,9 +370,9 @@ class Excel(plugins.output.OutputGenerator):
             self.write(sheet, risk_row, col + offset + 14, risk.residual_probability, end_row = row)
             self.write(sheet, risk_row, col + offset + 15, risk.residual_risk, format = self.risk_formats[residual_risk_score], end_row = row)
             row += 1
+            self.flush(sheet, row)
 
         self.set_paper(sheet, start_row - 1)
-        self.write_risk_summary(sheet, 1, total_risks, total_initial_scores, col + 9, total_residual_scores, col + 15)
         logger.info(f"done adding report sheet '{sheet.title}'")
 
     #
@@ -339,19 +382,14 @@ class Excel(plugins.output.OutputGenerator):
         logger.info(f"adding report sheet '{sheet.title}'")
 
         # risks, sorted by harm
-        total_risks = 0
-        total_initial_scores = self.jira.risk_scores
-        total_residual_scores = self.jira.risk_scores
+        risks = self.jira.sorted_by_harm(self.jira.filter_by_key(self.jira.risks.values(), props.get('filter')))
+        scores, total_initial_scores, total_residual_scores = self.score_risks(risks)
+        self.write_risk_summary(sheet, 1, len(risks), total_initial_scores, start_col + 5, total_residual_scores, start_col + 6)
         row = start_row
-        for risk in self.jira.sorted_by_harm(self.jira.filter_by_key(self.jira.risks.values(), props.get('filter'))):
+        for risk, (initial_risk_score, residual_risk_score) in zip(risks, scores):
             log_issue(risk)
             risk_row = row
             col = start_col
-            total_risks += 1
-            initial_risk_score = risk.score(risk.initial_risk, 'initial')
-            total_initial_scores[initial_risk_score] += 1
-            residual_risk_score = risk.score(risk.residual_risk, 'residual')
-            total_residual_scores[residual_risk_score] += 1
 
             # list all mitigations in the sheet
             story_row = row
@@ -383,9 +421,9 @@ class Excel(plugins.output.OutputGenerator):
             self.write(sheet, risk_row, col + 5, risk.initial_risk, format = self.risk_formats[initial_risk_score], end_row = row)
             self.write(sheet, risk_row, col + 6, risk.residual_risk, format = self.risk_formats[residual_risk_score], end_row = row)
             row += 1
+            self.flush(sheet, row)
 
         self.set_paper(sheet, start_row - 1)
-        self.write_risk_summary(sheet, 1, total_risks, total_initial_scores, start_col + 5, total_residual_scores, start_col + 6)
         logger.info(f"done adding report sheet '{sheet.title}'")
 
     #
@@ -396,7 +434,7 @@ class Excel(plugins.output.OutputGenerator):
 
         # bugs, sorted by key
         row = start_row
-        for bug in self.jira.sorted_by_fix_version(self.jira.exclude_junk(self.jira.bugs.values(), enforce_versions = False)):
+        for bug in self.jira.sorted_bugs:
             log_issue(bug)
             col = start_col
 
@@ -408,6 +446,7 @@ class Excel(plugins.output.OutputGenerator):
             if not bug.reason_for_deferral:
                 logger.warn(f"{bug.key} ({','.join(bug.fix_versions)}): unresolved anomaly without reason for deferral")
             row += 1
+            self.flush(sheet, row)
         if row == start_row:
             self.write(sheet, row, start_col, props['empty'], end_col = start_col + 4)
 
@@ -431,6 +470,7 @@ class Excel(plugins.output.OutputGenerator):
                 self.write(sheet, row, col + 3, test.time)
                 self.write(sheet, row, col + 4, self.passed if test.status else '', format = 'bold')
                 row += 1
+                self.flush(sheet, row)
 
         self.set_paper(sheet, start_row - 1)
         logger.info(f"done adding report sheet '{sheet.title}'")
@@ -466,35 +506,47 @@ class Excel(plugins.output.OutputGenerator):
 
     def set_outline(self, sheet: openpyxl.worksheet, row: int, start_row: int, level: int = 1) -> None:
         if row > start_row:
-            sheet.row_dimensions.group(row, hidden = False, outline_level = level)
+            self.writer.outline(sheet, row, level)
         return
 
-    def write_tests(self, sheet: openpyxl.worksheet, row: int, col: int, issue) -> Tuple[int, bool]:
+    def set_outline_properties(self, sheet: openpyxl.worksheet) -> None:
+        # before anything is written, the streaming writer writes the sheet properties with the first row
+        sheet.sheet_properties.outlinePr = openpyxl.worksheet.properties.Outline(summaryBelow = False, summaryRight = False)
+
+    def flush(self, sheet: openpyxl.worksheet, row: int) -> None:
+        # rows before `row` are complete, and won't be written again
+        self.writer.flush(sheet, row)
+
+    def write_tests(self, sheet: openpyxl.worksheet, row: int, col: int, issue, tests: List) -> int:
         test_row = row
-        verified = False
-        for test in self.jira.sorted_by_key(issue.tests):
+        for test in tests:
             self.write_key_and_summary(sheet, test_row, col, test)
-            verified = verified or test.is_done
             self.set_outline(sheet, test_row, row, 1)
             test_row += 1
         if test_row == row: # there were no Xray tests
             self.write_key(sheet, test_row, col, issue)
             self.write(sheet, test_row, col + 1, self.labels['see_test_strategy'].format(story_key = issue.key))
             self.write_status(sheet, test_row, col + 2, issue)
-            verified = verified or issue.is_done
-        return ( test_row, verified )
+        return test_row
 
-    def write_risks(self, sheet: openpyxl.worksheet, row: int, col: int, issue, filter: List[str]) -> Tuple[int, bool]:
+    def write_risks(self, sheet: openpyxl.worksheet, row: int, col: int, risks: List) -> int:
         risk_row = row
-        mitigated = False
-        if filter:
-            logger.info(f"filtering risks by keys: {filter}")
-        for risk in self.jira.sorted_by_key(self.jira.exclude_junk(self.jira.filter_by_key(issue.risks, filter), enforce_versions = False)):
+        for risk in risks:
             self.write_key_and_summary(sheet, risk_row, col, risk)
-            mitigated = mitigated or risk.is_done
             self.set_outline(sheet, risk_row, row, 1)
             risk_row += 1
-        return ( risk_row, mitigated )
+        return risk_row
+
+    def score_risks(self, risks: List) -> Tuple[List[Tuple[JiraRiskScore, JiraRiskScore]], dict, dict]:
+        # initial and residual scores of the risks, and their totals, before any risk is written:
+        # the summary goes above the risks, and rows can't be written out of order when streaming
+        scores = [ (risk.score(risk.initial_risk, 'initial'), risk.score(risk.residual_risk, 'residual')) for risk in risks ]
+        total_initial_scores = self.jira.risk_scores
+        total_residual_scores = self.jira.risk_scores
+        for initial_risk_score, residual_risk_score in scores:
+            total_initial_scores[initial_risk_score] += 1
+            total_residual_scores[residual_risk_score] += 1
+        return scores, total_initial_scores, total_residual_scores
 
     def risk_format(self, risk_score: JiraRiskScore) -> str:
         return formats[risk_score]
@@ -518,12 +570,12 @@ class Excel(plugins.output.OutputGenerator):
         end_row = end_row or row
         end_col = end_col or col
         if end_row - row > 0 or end_col - col > 0:
-            sheet.merge_cells(start_row = row, start_column = col, end_row = end_row, end_column = end_col)
+            self.writer.merge(sheet, row, col, end_row, end_col)
             return True
         return False
 
     def write(self, sheet: openpyxl.worksheet, row: int, col: int, value, format: str = 'base', end_row: int = None, end_col: int = None, url: str = None) -> None:
-        cell = sheet.cell(row, col)
+        cell = self.writer.cell(sheet, row, col)
         cell.value = value
         if url:
             cell.hyperlink = url
@@ -546,8 +598,7 @@ class Excel(plugins.output.OutputGenerator):
             self.write(sheet, row, col, issue.key, format = 'base', end_row = end_row, end_col = end_col)
 
     def write_html(self, sheet: openpyxl.worksheet, row: int, col: int, value, end_row: int = None, end_col: int = None) -> None:
-        html = HtmlToExcel().parse(value)
-        self.write(sheet, row, col, html.rendered, format = 'summary', end_row = end_row, end_col = end_col)
+        self.write(sheet, row, col, self.html.convert(value), format = 'summary', end_row = end_row, end_col = end_col)
 
     def write_status(self, sheet: openpyxl.worksheet, row: int, col: int, issue, end_row: int = None) -> None:
         if issue.is_done:
@@ -562,8 +613,7 @@ class Excel(plugins.output.OutputGenerator):
 
     def set_paper(self, sheet: openpyxl.worksheet, header_row: int = None) -> None:
         sheet.page_setup.paperSize = openpyxl.worksheet.worksheet.Worksheet.PAPERSIZE_LEGAL
-        sheet.sheet_properties.outlinePr = openpyxl.worksheet.properties.Outline(summaryBelow = False, summaryRight = False)
-        sheet.print_area = sheet.dimensions
+        sheet.print_area = self.writer.dimensions(sheet)
         if header_row:
             sheet.print_title_rows = f"{header_row}:{header_row}"
         self.set_header_or_footer(sheet.oddHeader, self.config['page'].get('header'))
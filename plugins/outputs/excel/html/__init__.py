@@ -3,3 +3,4 @@ Copyright (c) 2020, Tidepool Project
 All rights reserved.
 """
 from .html_to_excel import HtmlToExcel
+from .converter import HtmlConverter
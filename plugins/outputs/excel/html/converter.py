@@ -0,0 +1,47 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from collections import OrderedDict
+import logging
+
+from .html_to_excel import HtmlToExcel
+
+logger = logging.getLogger(__name__)
+
+class HtmlConverter():
+    """
+    HTML to Excel cell text converter shared by all the cells of a report
+
+    A single parser is reused for every conversion, and conversions are kept in a bounded LRU cache keyed by the HTML,
+    since the same descriptions and summaries are written on several sheets.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.parser = HtmlToExcel()
+        self.conversions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, html: str) -> str:
+        text = self.conversions.get(html)
+        if text is not None:
+            self.conversions.move_to_end(html)
+            self.hits += 1
+            return text
+        self.misses += 1
+        text = self.parser.parse(html).rendered
+        self.conversions[html] = text
+        if len(self.conversions) > self.size:
+            self.conversions.popitem(last = False)
+        return text
+
+    def count(self, hits: int, misses: int) -> None:
+        # conversions done elsewhere, by the forked worker processes
+        self.hits += hits
+        self.misses += misses
+
+    def log_stats(self, level: int = logging.INFO) -> None:
+        total = self.hits + self.misses
+        if total:
+            logger.log(level, f"HTML conversions: {self.misses} converted, {self.hits} reused ({100 * self.hits / total:.0f}% hit rate), {len(self.conversions)} cached")
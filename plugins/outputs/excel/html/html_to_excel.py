@@ -14,7 +14,10 @@ class HtmlToExcel(html.parser.HTMLParser):
         self.nodes = [ ]
 
     def parse(self, text):
+        # the parser can be reused, each parse starts over
         self.reset()
+        self.nodes = [ ]
+        self.__dict__.pop('rendered', None)
         self.feed(text)
         self.close()
         return self
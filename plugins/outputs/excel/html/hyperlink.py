@@ -5,6 +5,9 @@ All rights reserved.
 import re
 from .base_segment import BaseSegment
 
+GOOGLE_DOCUMENT = re.compile(r"""https://docs.google.+""")
+JIRA_ISSUE = re.compile(r"""https://tidepool.atlassian.net/browse/(.+)""")
+
 class HyperLink(BaseSegment):
     def __init__(self, url, text = ''):
         super().__init__()
@@ -16,8 +19,8 @@ class HyperLink(BaseSegment):
 
     @property
     def pretty_link(self):
-        text = re.sub(r"""https://docs.google.+""", r"Google Document", self.text)
-        return re.sub(r"""https://tidepool.atlassian.net/browse/(.+)""", r"\1", text)
+        text = GOOGLE_DOCUMENT.sub(r"Google Document", self.text)
+        return JIRA_ISSUE.sub(r"\1", text)
 
     @property
     def is_empty(self):
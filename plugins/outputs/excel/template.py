@@ -0,0 +1,76 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from typing import Dict, List, NamedTuple, Tuple
+import hashlib
+import logging
+import ast
+import re
+import openpyxl
+
+logger = logging.getLogger(__name__)
+
+SUBSTITUTION = re.compile(r'\{.+\}')
+INSERTION = re.compile(r'<<<insert: (\w+)\((.*)\)>>>')
+
+# steps tell their kind rather than being tested by class, because pluginlib may execute the plugin modules
+# more than once, and the classes imported by excel.py are then not the ones the plan is built with
+
+class Substitution(NamedTuple):
+    row: int
+    column: int
+    text: str
+    is_insertion = False
+
+class Insertion(NamedTuple):
+    row: int
+    column: int
+    method: str
+    props: dict
+    is_insertion = True
+
+class TemplatePlan():
+    """
+    Substitution cells and `<<<insert: method_name(properties)>>>` directives of an Excel template, by sheet title
+
+    The template cells are scanned once per template content, and the plan is shared by every report generated
+    from the same template. Steps are in the order the cells appear in the sheet (row by row).
+    Directives are matched in the template text, before the substitutions: a directive that would only appear once
+    a cell is substituted (from the timestamp, build number or tag) is not inserted.
+    """
+    plans: Dict[str, 'TemplatePlan'] = { } # by SHA-256 of the template file
+
+    def __init__(self, book: openpyxl.Workbook):
+        self.sheets: Dict[str, List[Tuple]] = { }
+        for sheet in book.worksheets:
+            steps = [ ]
+            for row in sheet.iter_rows():
+                for cell in row:
+                    if not isinstance(cell.value, str):
+                        continue
+                    if SUBSTITUTION.search(cell.value):
+                        steps.append(Substitution(cell.row, cell.column, cell.value))
+                    insertion = INSERTION.search(cell.value)
+                    if insertion:
+                        props = { }
+                        if insertion.group(2):
+                            logger.debug(f"parsing {insertion.group(2)}")
+                            props = ast.literal_eval('{' + insertion.group(2) + '}')
+                            logger.debug(f"got {props}")
+                        steps.append(Insertion(cell.row, cell.column, insertion.group(1), props))
+            self.sheets[sheet.title] = steps
+
+    @classmethod
+    def compile(cls, template_file: str, book: openpyxl.Workbook) -> 'TemplatePlan':
+        with open(template_file, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        plan = cls.plans.get(digest)
+        if plan is None:
+            logger.info(f"compiling template {template_file}")
+            plan = cls(book)
+            cls.plans[digest] = plan
+        return plan
+
+    def steps(self, sheet: openpyxl.worksheet) -> List[Tuple]:
+        return self.sheets.get(sheet.title, [ ])
@@ -0,0 +1,348 @@
+"""
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+from copy import copy
+from operator import itemgetter
+from typing import Dict, Iterator, List, Set, Tuple
+import logging
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils.cell import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.merge import MergedCellRange
+from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
+
+logger = logging.getLogger(__name__)
+
+# the batched writes (see WorkbookWriter.apply) take shortcuts through openpyxl internals, which hold for the version
+# pinned in requirements.txt: with any other version, they go through the public API instead
+OPENPYXL_PINNED = '3.0.5'
+OPENPYXL_INTERNALS = openpyxl.__version__ == OPENPYXL_PINNED
+if not OPENPYXL_INTERNALS:
+    logger.warning(f"openpyxl {openpyxl.__version__} is not the pinned {OPENPYXL_PINNED}, Excel writes go through the public API")
+
+class WorkbookWriter():
+    """
+    Report built in the template workbook itself, in memory, with random access to every cell
+    """
+    def __init__(self, template_file: str, styles: List[openpyxl.styles.NamedStyle]):
+        self.template = openpyxl.load_workbook(template_file)
+        for style in styles:
+            self.template.add_named_style(style)
+        self.style_arrays = { } # resolved named styles, by name
+        self.merged = { } # coordinates of the merged ranges, by sheet title
+
+    @property
+    def sheets(self) -> Iterator[Worksheet]:
+        return iter(self.template.worksheets)
+
+    def cell(self, sheet, row: int, col: int):
+        return sheet.cell(row, col)
+
+    def merge(self, sheet, row: int, col: int, end_row: int, end_col: int) -> None:
+        sheet.merge_cells(start_row = row, start_column = col, end_row = end_row, end_column = end_col)
+
+    def merged_coords(self, sheet) -> Set[str]:
+        coords = self.merged.get(sheet.title)
+        if coords is None:
+            coords = { merged.coord for merged in sheet.merged_cells.ranges }
+            self.merged[sheet.title] = coords
+        return coords
+
+    def merge_all(self, sheet, merges: List[Tuple[int, int, int, int]]) -> None:
+        # merge_cells checks every new range against all the merged ranges of the sheet, which is quadratic;
+        # the ranges of a report don't overlap, so they are added at once, only skipping exact duplicates
+        if not OPENPYXL_INTERNALS:
+            for merge in merges:
+                self.merge(sheet, *merge)
+            return
+        coords = self.merged_coords(sheet)
+        for row, col, end_row, end_col in merges:
+            merged = MergedCellRange(sheet, CellRange(min_col = col, min_row = row, max_col = end_col, max_row = end_row).coord)
+            if merged.coord not in coords:
+                coords.add(merged.coord)
+                sheet.merged_cells.ranges.append(merged)
+                sheet._clean_merge_range(merged) # pylint: disable=protected-access
+
+    def outline(self, sheet, row: int, level: int, end_row: int = None) -> None:
+        sheet.row_dimensions.group(row, end_row, hidden = False, outline_level = level)
+
+    def dimensions(self, sheet) -> str:
+        return sheet.dimensions
+
+    def flush(self, sheet, row: int) -> None:
+        # rows before `row` are complete, nothing to do when everything stays in memory
+        pass
+
+    def close_sheet(self, sheet) -> None:
+        pass
+
+    def save(self, output_file: str) -> None:
+        self.template.save(output_file)
+
+    def set_style(self, cell, name: str) -> None:
+        # assigning a named style looks it up by name in the workbook every time, so do that once per style
+        if not OPENPYXL_INTERNALS:
+            cell.style = name
+            return
+        style_array = self.style_arrays.get(name)
+        if style_array is None:
+            cell.style = name
+            self.style_arrays[name] = copy(cell._style)
+        else:
+            cell._style = copy(style_array)
+
+    def apply(self, sheet, model: 'SheetModel') -> None:
+        """
+        Write the rows recorded by a RecordingWriter in one pass: cells in row order, then the outlines, with runs of
+        consecutive rows at the same level grouped at once, then the merges
+        """
+        rows = { }
+        for (row, col), recorded in model.cells.items():
+            rows.setdefault(row, [ ]).append((col, recorded))
+        for row in sorted(rows):
+            for col, recorded in sorted(rows[row], key = itemgetter(0)):
+                cell = self.cell(sheet, row, col)
+                cell.value = recorded.value
+                if recorded.hyperlink:
+                    cell.hyperlink = recorded.hyperlink
+                if recorded.style:
+                    self.set_style(cell, recorded.style)
+        for start_row, end_row, level in outline_runs(model.outlines):
+            self.outline(sheet, start_row, level, end_row)
+        self.merge_all(sheet, model.merges)
+
+class StreamingWriter(WorkbookWriter):
+    """
+    Report streamed row by row into a write-only workbook (openpyxl write-only mode), in constant memory
+
+    The template is loaded to copy its cells, styles, merges, column widths, row heights, views and page setup into
+    the new sheets. Rows are kept until the report flushes them, and are then written in order: generators must flush
+    the rows they are done with, and must not write into a row once it is flushed. Sheet properties (such as the
+    outline settings), column widths and views are written with the first row, so they must be set before that.
+    """
+    def __init__(self, template_file: str, styles: List[openpyxl.styles.NamedStyle]):
+        super().__init__(template_file, [ ])
+        self.book = openpyxl.Workbook(write_only = True)
+        for style in styles:
+            self.book.add_named_style(style)
+        self.cells: Dict[str, Dict[int, Dict[int, WriteOnlyCell]]] = { } # by sheet title, row and column
+        self.row_dimensions: Dict[str, Dict[int, dict]] = { }
+        self.next_row: Dict[str, int] = { }
+        self.max_row: Dict[str, int] = { }
+        self.max_col: Dict[str, int] = { }
+
+    @property
+    def sheets(self) -> Iterator[WriteOnlyWorksheet]:
+        for template in self.template.worksheets:
+            yield self.create_sheet(template)
+
+    def create_sheet(self, template: Worksheet) -> WriteOnlyWorksheet:
+        sheet = self.book.create_sheet(template.title)
+        self.cells[sheet.title] = { }
+        self.row_dimensions[sheet.title] = { }
+        self.next_row[sheet.title] = 1
+        self.max_row[sheet.title] = 0
+        self.max_col[sheet.title] = 0
+        for name in [ 'sheet_properties', 'sheet_format', 'views', 'page_setup', 'print_options', 'page_margins', 'HeaderFooter' ]:
+            setattr(sheet, name, copy(getattr(template, name)))
+        for key, dimension in template.column_dimensions.items():
+            sheet.column_dimensions[key].width = dimension.width
+            sheet.column_dimensions[key].hidden = dimension.hidden
+        for row, dimension in template.row_dimensions.items():
+            if dimension.height is not None:
+                self.row_dimensions[sheet.title].setdefault(row, { })['height'] = dimension.height
+        for row in template.iter_rows():
+            for source in row:
+                if source.value is None and not source.has_style:
+                    continue
+                cell = self.cell(sheet, source.row, source.column)
+                cell.value = source.value
+                if source.has_style:
+                    cell.font = copy(source.font)
+                    cell.fill = copy(source.fill)
+                    cell.border = copy(source.border)
+                    cell.alignment = copy(source.alignment)
+                    cell.number_format = source.number_format
+                    cell.protection = copy(source.protection)
+                if source.hyperlink:
+                    cell.hyperlink = copy(source.hyperlink)
+        for merged in template.merged_cells.ranges:
+            sheet.merged_cells.add(CellRange(merged.coord))
+        return sheet
+
+    def cell(self, sheet, row: int, col: int) -> WriteOnlyCell:
+        if row < self.next_row[sheet.title]:
+            raise ValueError(f"row {row} of sheet '{sheet.title}' was already written")
+        cells = self.cells[sheet.title].setdefault(row, { })
+        cell = cells.get(col)
+        if cell is None:
+            cell = WriteOnlyCell(sheet)
+            cells[col] = cell
+            self.max_row[sheet.title] = max(self.max_row[sheet.title], row)
+            self.max_col[sheet.title] = max(self.max_col[sheet.title], col)
+        return cell
+
+    def merge(self, sheet, row: int, col: int, end_row: int, end_col: int) -> None:
+        sheet.merged_cells.add(CellRange(min_col = col, min_row = row, max_col = end_col, max_row = end_row))
+
+    def merge_all(self, sheet, merges: List[Tuple[int, int, int, int]]) -> None:
+        # only written with the sheet tail, see WorkbookWriter.merge_all
+        if not OPENPYXL_INTERNALS:
+            for merge in merges:
+                self.merge(sheet, *merge)
+            return
+        coords = self.merged_coords(sheet)
+        for row, col, end_row, end_col in merges:
+            merged = CellRange(min_col = col, min_row = row, max_col = end_col, max_row = end_row)
+            if merged.coord not in coords:
+                coords.add(merged.coord)
+                sheet.merged_cells.ranges.append(merged)
+
+    def outline(self, sheet, row: int, level: int, end_row: int = None) -> None:
+        if row < self.next_row[sheet.title]:
+            raise ValueError(f"row {row} of sheet '{sheet.title}' was already written")
+        for index in range(row, (end_row or row) + 1):
+            self.row_dimensions[sheet.title].setdefault(index, { }).update({ 'outlineLevel': level, 'hidden': False })
+
+    def dimensions(self, sheet) -> str:
+        return f"A1:{get_column_letter(max(self.max_col[sheet.title], 1))}{max(self.max_row[sheet.title], 1)}"
+
+    def flush(self, sheet, row: int) -> None:
+        cells = self.cells[sheet.title]
+        row_dimensions = self.row_dimensions[sheet.title]
+        for index in range(self.next_row[sheet.title], row):
+            # the dimensions are read when the row is written, and are not needed after that
+            for name, value in row_dimensions.pop(index, { }).items():
+                setattr(sheet.row_dimensions[index], name, value)
+            row_cells = cells.pop(index, { })
+            sheet.append([ row_cells.get(col) for col in range(1, max(row_cells, default = 0) + 1) ])
+            sheet.row_dimensions.pop(index, None)
+        self.next_row[sheet.title] = max(self.next_row[sheet.title], row)
+
+    def close_sheet(self, sheet) -> None:
+        self.flush(sheet, max(self.max_row[sheet.title], *self.row_dimensions[sheet.title], 0) + 1)
+        logger.debug(f"streamed {self.max_row[sheet.title]} rows of sheet '{sheet.title}'")
+
+    def save(self, output_file: str) -> None:
+        self.book.save(output_file)
+
+class RecordedCell():
+    __slots__ = ('value', 'style', 'hyperlink')
+
+    def __init__(self):
+        self.value = None
+        self.style = None
+        self.hyperlink = None
+
+class SheetModel():
+    """
+    Serializable rows of a sheet: cell values, style names and hyperlinks by (row, column), merges, row outline levels,
+    and the print title rows
+    """
+    __slots__ = ('cells', 'merges', 'outlines', 'print_title_rows')
+
+    def __init__(self):
+        self.cells: Dict[Tuple[int, int], RecordedCell] = { }
+        self.merges: List[Tuple[int, int, int, int]] = [ ]
+        self.outlines: Dict[int, int] = { }
+        self.print_title_rows: str = None
+
+class RecordingWriter():
+    """
+    Rows recorded into a SheetModel per sheet, rather than written, for a process that doesn't own the workbook
+
+    The sheets are the template sheets, which only serve for their title and dimensions; the page setup applied to them
+    is not kept, other than the print title rows.
+    """
+    def __init__(self):
+        self.models: Dict[str, SheetModel] = { }
+
+    def model(self, sheet) -> SheetModel:
+        return self.models.setdefault(sheet.title, SheetModel())
+
+    def cell(self, sheet, row: int, col: int) -> RecordedCell:
+        return self.model(sheet).cells.setdefault((row, col), RecordedCell())
+
+    def merge(self, sheet, row: int, col: int, end_row: int, end_col: int) -> None:
+        self.model(sheet).merges.append((row, col, end_row, end_col))
+
+    def outline(self, sheet, row: int, level: int, end_row: int = None) -> None:
+        for index in range(row, (end_row or row) + 1):
+            self.model(sheet).outlines[index] = level
+
+    def dimensions(self, sheet) -> str:
+        cells = self.model(sheet).cells
+        max_row = max([ sheet.max_row, *[ row for row, col in cells ] ])
+        max_col = max([ sheet.max_column, *[ col for row, col in cells ] ])
+        return f"A1:{get_column_letter(max_col)}{max_row}"
+
+    def flush(self, sheet, row: int) -> None:
+        pass
+
+    def close_sheet(self, sheet) -> None:
+        self.model(sheet).print_title_rows = sheet.print_title_rows
+
+class BufferedWriter(RecordingWriter):
+    """
+    Writes collected per sheet, and applied to the target writer in batches (see WorkbookWriter.apply) when rows are
+    flushed, when the sheet dimensions are needed, and when the sheet is complete
+    """
+    def __init__(self, target: WorkbookWriter):
+        super().__init__()
+        self.target = target
+
+    @property
+    def template(self) -> openpyxl.Workbook:
+        return self.target.template
+
+    @property
+    def sheets(self) -> Iterator:
+        return self.target.sheets
+
+    def apply(self, sheet, model: SheetModel) -> None:
+        self.apply_pending(sheet)
+        self.target.apply(sheet, model)
+
+    def apply_pending(self, sheet) -> None:
+        model = self.models.pop(sheet.title, None)
+        if model:
+            self.target.apply(sheet, model)
+
+    def dimensions(self, sheet) -> str:
+        self.apply_pending(sheet)
+        return self.target.dimensions(sheet)
+
+    def flush(self, sheet, row: int) -> None:
+        self.apply_pending(sheet)
+        self.target.flush(sheet, row)
+
+    def close_sheet(self, sheet) -> None:
+        self.apply_pending(sheet)
+        self.target.close_sheet(sheet)
+
+    def save(self, output_file: str) -> None:
+        self.target.save(output_file)
+
+def outline_runs(outlines: Dict[int, int]) -> Iterator[Tuple[int, int, int]]:
+    """
+    (start row, end row, level) of the runs of consecutive rows with the same outline level
+    """
+    run = None
+    for row in sorted(outlines):
+        level = outlines[row]
+        if run and run[1] == row - 1 and run[2] == level:
+            run = (run[0], row, level)
+            continue
+        if run:
+            yield run
+        run = (row, row, level)
+    if run:
+        yield run
+
+WRITERS = {
+    'workbook': WorkbookWriter,
+    'streaming': StreamingWriter,
+}
@@ -32,17 +32,19 @@ class GraphViz(plugins.output.OutputGenerator):
         logger.info(f"generating {graph_file}")
         graph = Digraph(comment = f"Generated on {self.config['generated']}", graph_attr = {'rankdir': 'LR', 'splines': 'ortho'}, node_attr = {'shape': 'none'})
 
-        for req in self.jira.sorted_by_id(self.jira.func_requirements.values()):
+        for trace in self.jira.traceability(self.key).requirements:
+            req = trace.requirement
             self.add_node(graph, req)
 
-            for risk in self.jira.sorted_by_key(req.risks):
+            for risk in trace.risks:
                 self.add_node(graph, risk)
                 self.add_edge(graph, req, risk)
 
-            for story in self.jira.sorted_by_key(req.stories):
+            for story_trace in trace.stories:
+                story = story_trace.story
                 self.add_node(graph, story)
                 self.add_edge(graph, req, story)
-                for test in self.jira.sorted_by_key(story.tests):
+                for test in story_trace.tests:
                     self.add_node(graph, test)
                     self.add_edge(graph, story, test)
 
@@ -106,10 +106,15 @@ def main():
     logger.debug('connecting to input sources')
     inputs = { }
     for plugin in plugin_loader.plugins.input.values():
-        if plugin.key in config:
+        if plugin.key in config and config[plugin.key].get('client', 'default') == plugin.client:
             logger.debug(f'connecting to {plugin.name}')
             inputs[plugin.key] = plugin({ **config[plugin.key], **options })
 
+    if args.outputs:
+        logger.debug('prefetching input sources')
+        for source in inputs.values():
+            source.prefetch()
+
     logger.debug('execute selected output generators')
     files = set()
     for plugin_name in (args.outputs or [ ]):
@@ -118,6 +123,9 @@ def main():
         files.update(plugin({ **config[plugin.key], **options }, inputs).generate())
         logger.info(f'done generating {plugin.name} output')
 
+    for source in inputs.values():
+        source.close()
+
     if args.zip and 'zip' in config:
         logger.info(f"generating ZIP file {config['zip']['output']} from {files}")
         with ZipFile(config['zip']['output'], mode = 'w', compression = ZIP_DEFLATED) as zipfile:
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Compare the size on disk and load time of the JSON and compact cache formats
+
+Reads the existing `stories` and `tests` cache entries (in either format) from the cache folder,
+writes them out in both formats into a temporary folder, and times loading each of them.
+
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from plugins.cache import FileCache # pylint: disable=wrong-import-position
+
+def load_time(cache: FileCache, key: str, repeat: int) -> float:
+    """
+    median time to read a cache entry, in seconds
+    """
+    timings = [ ]
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cache.read(key, expire = False)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main():
+    """
+    write each cache entry in every format, and time reading it back
+    """
+    parser = argparse.ArgumentParser(description = 'Benchmark the cache formats')
+    parser.add_argument('--folder', default = 'cache', help = 'cache folder (default: cache)')
+    parser.add_argument('--repeat', type = int, default = 5, help = 'number of loads to time (default: 5)')
+    parser.add_argument('keys', nargs = '*', default = [ 'stories', 'tests' ], help = 'cache keys (default: stories tests)')
+    args = parser.parse_args()
+
+    source = FileCache({ 'folder': args.folder, 'refresh': 0 }, 'jira')
+    with tempfile.TemporaryDirectory() as folder:
+        caches = {
+            'json': FileCache({ 'folder': os.path.join(folder, 'json'), 'refresh': 0, 'format': 'json' }, 'jira'),
+            'compact': FileCache({ 'folder': os.path.join(folder, 'compact'), 'refresh': 0, 'format': 'compact' }, 'jira'),
+            'compact (json module)': FileCache({ 'folder': os.path.join(folder, 'compact-json'), 'refresh': 0, 'format': 'compact', 'codec': 'json' }, 'jira'),
+        }
+        print(f"{'key':<10} {'format':<24} {'bytes':>12} {'load (ms)':>10}")
+        for key in args.keys:
+            content = source.read(key, expire = False)
+            if content is None:
+                print(f"{key:<10} no cache entry in {args.folder}")
+                continue
+            for name, cache in caches.items():
+                cache.write(key, content)
+                size = os.path.getsize(cache.filename(key, cache.compact))
+                print(f"{key:<10} {name:<24} {size:>12,} {load_time(cache, key, args.repeat) * 1000:>10.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Compare writing Excel cells one call at a time, and through the buffered writer
+
+Writes synthetic stories with their tests into every sheet of the Excel template, the way the traceability and
+verification reports do: a key with a hyperlink and a summary merged across the rows of the tests, and one outlined
+row per test. Each write either goes straight to the writer (style by name, hyperlink, merge and row group per call),
+or through BufferedWriter, which applies the writes in batches.
+
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+import os
+import sys
+import time
+import argparse
+import openpyxl
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, BASE_DIR)
+from plugins.outputs.excel.writer import WRITERS, BufferedWriter # pylint: disable=wrong-import-position
+
+STYLES = [ 'base', 'summary', 'url', 'bold' ]
+
+def styles():
+    """
+    named styles used by the synthetic rows
+    """
+    return [ openpyxl.styles.NamedStyle(name = name, font = openpyxl.styles.Font(bold = name == 'bold', underline = 'single' if name == 'url' else None)) for name in STYLES ]
+
+def write(cell, value, style: str, url: str = None) -> None:
+    """
+    set a cell as Excel.write does
+    """
+    cell.value = value
+    if url:
+        cell.hyperlink = url
+    cell.style = style
+
+def fill(writer, sheet, stories: int, tests: int) -> int:
+    """
+    write the synthetic stories and tests into a sheet, returns the number of cells written
+    """
+    cells = 0
+    row = 100 # below the template content
+    for story in range(stories):
+        story_row = row
+        for test in range(tests):
+            write(writer.cell(sheet, row, 3), f'TEST-{story}-{test}', 'url', url = f'https://example.com/TEST-{story}-{test}')
+            write(writer.cell(sheet, row, 4), f'Test {test} of story {story}', 'summary')
+            write(writer.cell(sheet, row, 5), 'PASSED', 'bold')
+            if row > story_row:
+                writer.outline(sheet, row, 1)
+            row += 1
+            cells += 3
+        write(writer.cell(sheet, story_row, 1), f'STORY-{story}', 'url', url = f'https://example.com/STORY-{story}')
+        write(writer.cell(sheet, story_row, 2), f'Summary of story {story}', 'summary')
+        if row - 1 > story_row: # key and summary merged across the rows of the tests
+            writer.merge(sheet, story_row, 1, row - 1, 1)
+            writer.merge(sheet, story_row, 2, row - 1, 2)
+        cells += 2
+        writer.flush(sheet, row)
+    return cells
+
+def measure(writer_name: str, buffered: bool, args: argparse.Namespace) -> float:
+    """
+    fill every sheet of the template with one writer, directly or buffered, returns cells per second
+    """
+    writer = WRITERS[writer_name](args.template, styles())
+    if buffered:
+        writer = BufferedWriter(writer)
+    cells = 0
+    start = time.perf_counter()
+    for sheet in writer.sheets:
+        cells += fill(writer, sheet, args.stories, args.tests)
+        writer.close_sheet(sheet)
+    elapsed = time.perf_counter() - start
+    writer.save(args.output)
+    return cells / elapsed
+
+def main():
+    """
+    compare each writer, direct and buffered
+    """
+    parser = argparse.ArgumentParser(description = 'Benchmark the buffered Excel writer')
+    parser.add_argument('--template', default = os.path.join(BASE_DIR, 'templates', 'excel', 'full-template.xlsx'), help = 'Excel template (default: templates/excel/full-template.xlsx)')
+    parser.add_argument('--output', default = os.path.join(BASE_DIR, 'output', 'benchmark.xlsx'), help = 'scratch output file (default: output/benchmark.xlsx)')
+    parser.add_argument('--stories', type = int, default = 200, help = 'stories per sheet (default: 200)')
+    parser.add_argument('--tests', type = int, default = 5, help = 'tests per story (default: 5)')
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok = True)
+    print(f"{'writer':<10} {'direct (cells/s)':>17} {'buffered (cells/s)':>19} {'speedup':>8}")
+    for writer_name in WRITERS:
+        direct = measure(writer_name, False, args)
+        buffered = measure(writer_name, True, args)
+        print(f"{writer_name:<10} {direct:>17.0f} {buffered:>19.0f} {buffered / direct:>7.1f}x")
+    os.remove(args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Compare classifying and filtering Jira issues by list membership tests and by type bit flags
+
+Generates synthetic issues with the issue types and link types of the Jira configuration, then times
+resolving the class of every link (JiraLink.issue_class) and filtering the issues by type both ways.
+
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+import os
+import sys
+import random
+import timeit
+import argparse
+import yaml
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, BASE_DIR)
+from plugins.inputs.jira.types import JiraTypes, ISSUE_CLASSES # pylint: disable=wrong-import-position
+
+class Issue():
+    """
+    synthetic issue, with only what the type tests read
+    """
+    __slots__ = ('type', 'project_key', 'type_mask')
+
+    def __init__(self, type_id: int, project_key: str, types: JiraTypes):
+        self.type = type_id
+        self.project_key = project_key
+        self.type_mask = types.issue_mask(type_id, project_key)
+
+def is_a(issue_types: dict, issue: Issue, type_name: str) -> bool:
+    """
+    type test as it was done before the bit flags
+    """
+    issue_type = issue_types[type_name]
+    return issue.type in issue_type['ids'] and issue.project_key in issue_type['projects']
+
+def issue_class(issue_types: dict, issue: Issue) -> str:
+    """
+    class of a linked issue as it was resolved before the bit flags
+    """
+    return next((issue_class for type_name, issue_class in ISSUE_CLASSES if is_a(issue_types, issue, type_name)), 'JiraIssue')
+
+def main():
+    """
+    time the membership tests against the bit flags on synthetic issues
+    """
+    parser = argparse.ArgumentParser(description = 'Benchmark issue type classification')
+    parser.add_argument('--config', default = os.path.join(BASE_DIR, 'config', 'inputs', 'jira.yml'), help = 'Jira configuration file (default: config/inputs/jira.yml)')
+    parser.add_argument('--issues', type = int, default = 10000, help = 'number of synthetic issues (default: 10000)')
+    parser.add_argument('--repeat', type = int, default = 20, help = 'number of timed runs (default: 20)')
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as config:
+        config = yaml.safe_load(config)
+    issue_types = config['issue_types']
+    types = JiraTypes(issue_types, config['link_types'])
+    random.seed(0)
+    pairs = [ (type_id, project) for issue_type in issue_types.values() for type_id in issue_type['ids'] for project in issue_type['projects'] ]
+    issues = [ Issue(*random.choice(pairs), types) for _ in range(args.issues) ]
+    assert all(issue_class(issue_types, issue) == types.issue_class(issue.type_mask) for issue in issues)
+    assert all(is_a(issue_types, issue, 'story') == bool(issue.type_mask & types.issue_bit('story')) for issue in issues)
+
+    benchmarks = {
+        'issue class': (
+            lambda: [ issue_class(issue_types, issue) for issue in issues ],
+            lambda: [ types.issue_class(issue.type_mask) for issue in issues ]),
+        'filter stories': (
+            lambda: [ issue for issue in issues if is_a(issue_types, issue, 'story') ],
+            lambda: types.filter(issues, 'story')),
+        'filter stories, tests and risks': (
+            lambda: [ issue for issue in issues if is_a(issue_types, issue, 'story') or is_a(issue_types, issue, 'test') or is_a(issue_types, issue, 'risk') ],
+            lambda: types.filter(issues, 'story', 'test', 'risk')),
+    }
+    print(f"{'benchmark':<32} {'membership (ms)':>16} {'bit flags (ms)':>15} {'speedup':>8}")
+    for name, (membership, flags) in benchmarks.items():
+        before = min(timeit.repeat(membership, number = 1, repeat = args.repeat)) * 1000
+        after = min(timeit.repeat(flags, number = 1, repeat = args.repeat)) * 1000
+        print(f"{name:<32} {before:>16.2f} {after:>15.2f} {before / after:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Report the payload size of each Jira query with all fields and with the projected field list
+
+Fetches the first page of every query in the Jira configuration both ways and prints the size of the
+responses, and the size of the projected response once unused rendered fields are trimmed for the cache.
+Uses the same JIRA_* environment variables (or .env file) as report.py.
+
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+import os
+import sys
+import json
+import argparse
+import yaml
+from yamlinclude import YamlIncludeConstructor
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), '..')
+CONF_DIR = os.path.join(BASE_DIR, 'config')
+sys.path.insert(0, BASE_DIR)
+from plugins.inputs.jira.helper import JiraHelper # pylint: disable=wrong-import-position
+
+def main():
+    """
+    fetch the first page of every query with all fields and with the projected fields, and compare their sizes
+    """
+    parser = argparse.ArgumentParser(description = 'Compare Jira payload sizes with and without field projection')
+    parser.add_argument('--config', default = os.path.join(CONF_DIR, 'report.yml'), help = 'configuration file (default: config/report.yml)')
+    args = parser.parse_args()
+
+    YamlIncludeConstructor.add_to_loader_class(loader_class = yaml.SafeLoader, base_dir = CONF_DIR)
+    load_dotenv()
+    with open(args.config, 'r') as config:
+        config = yaml.safe_load(config)
+    jira = JiraHelper({ **config['jira'], 'refresh_cache': False, 'verbose': False })
+
+    print(f"{'query':<20} {'issues':>6} {'all fields':>12} {'projected':>12} {'reduction':>10} {'cached':>12}")
+    for query, jql in jira.queries.items():
+        jql = jql.format(**jira.parameters)
+        full = jira.jira.jql(jql, start = 0, limit = jira.page_size, fields = jira.all_field_list, expand = 'renderedFields')
+        projected = jira.jira.jql(jql, start = 0, limit = jira.page_size, fields = jira.projected_field_list, expand = 'renderedFields')
+        full_size = len(json.dumps(full))
+        projected_size = len(json.dumps(projected))
+        jira.trim_rendered_fields(projected['issues'])
+        cached_size = len(json.dumps(projected))
+        reduction = 100 * (1 - projected_size / full_size) if full_size else 0
+        print(f"{query:<20} {len(full['issues']):>6} {full_size:>12,} {projected_size:>12,} {reduction:>9.1f}% {cached_size:>12,}")
+    jira.close()
+
+if __name__ == '__main__':
+    main()
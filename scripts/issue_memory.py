@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Report the peak RSS of holding the cached Jira query results as raw JSON dicts, and as compact issue records
+
+Each representation is measured in its own process, loading the query results from the Jira cache (expired
+entries included), so run a report first to fill the cache.
+
+Copyright (c) 2020, Tidepool Project
+All rights reserved.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import resource
+import subprocess
+import yaml
+from yamlinclude import YamlIncludeConstructor
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), '..')
+CONF_DIR = os.path.join(BASE_DIR, 'config')
+sys.path.insert(0, BASE_DIR)
+from plugins.cache import create_cache # pylint: disable=wrong-import-position
+from plugins.inputs.jira.helper import RENDERED_FIELDS # pylint: disable=wrong-import-position
+from plugins.inputs.jira.record import JiraRecord # pylint: disable=wrong-import-position
+from plugins.inputs.jira.types import JiraTypes # pylint: disable=wrong-import-position
+
+MODES = [ 'raw', 'compact' ]
+
+def rss_mb() -> float:
+    """
+    resident set size of this process, in megabytes
+    """
+    with open('/proc/self/status', 'r') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def measure(config: dict, mode: str) -> dict:
+    """
+    load every cached query, as raw JSON or as compact records, and report the time and memory it took
+    """
+    cache = create_cache(config['cache'], 'jira')
+    fields = config['fields']
+    custom_ids = tuple(dict.fromkeys(fields.values()))
+    rendered_ids = { fields.get(name, name) for name in RENDERED_FIELDS }
+    types = JiraTypes(config['issue_types'], config['link_types'])
+    baseline = rss_mb()
+    start = time.perf_counter()
+    issues = [ ]
+    for query in config['queries']:
+        results = cache.read_issues(query, expire = False) or [ ]
+        if mode == 'compact':
+            results = [ JiraRecord.decode(issue, types, custom_ids, rendered_ids) for issue in results ]
+        issues.extend(results)
+        del results
+    gc.collect()
+    return {
+        'issues': len(issues),
+        'seconds': time.perf_counter() - start,
+        'baseline': baseline,
+        'current': rss_mb(),
+        'peak': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, # kilobytes on Linux
+    }
+
+def main():
+    """
+    measure each representation in its own process, so that their memory doesn't add up
+    """
+    parser = argparse.ArgumentParser(description = 'Compare the memory used by raw and compact Jira issues')
+    parser.add_argument('--config', default = os.path.join(CONF_DIR, 'report.yml'), help = 'configuration file (default: config/report.yml)')
+    parser.add_argument('--mode', choices = MODES, help = 'measure a single representation in this process')
+    args = parser.parse_args()
+
+    YamlIncludeConstructor.add_to_loader_class(loader_class = yaml.SafeLoader, base_dir = CONF_DIR)
+    with open(args.config, 'r') as config:
+        config = yaml.safe_load(config)
+
+    if args.mode:
+        print(json.dumps(measure(config['jira'], args.mode)))
+        return
+
+    print(f"{'mode':<8} {'issues':>7} {'load (s)':>9} {'baseline (MB)':>14} {'current (MB)':>13} {'peak (MB)':>10}")
+    for mode in MODES:
+        output = subprocess.run([ sys.executable, __file__, '--config', args.config, '--mode', mode ], check = True, capture_output = True, text = True).stdout
+        res = json.loads(output.splitlines()[-1])
+        print(f"{mode:<8} {res['issues']:>7} {res['seconds']:>9.2f} {res['baseline']:>14.1f} {res['current']:>13.1f} {res['peak']:>10.1f}")
+
+if __name__ == '__main__':
+    main()